@@ -16,26 +16,46 @@ https://github.com/dqminh/flask-mongoobject
 """
 
 from __future__ import absolute_import
+import base64
+import bisect
 import copy
+import functools
+import logging
 import operator
+import os
+import random
+import struct
+import threading
+import time
 import trafaret as t
 
-from flask import abort
+from bson import BSON, SON
+from bson.dbref import DBRef
+from bson.objectid import ObjectId
+from bson.errors import InvalidBSON
+
+from flask import abort, request
 from flask.signals import _signals
 
+from collections import deque, OrderedDict
+from contextlib import contextmanager
 from importlib import import_module
 
-from pymongo import Connection, ASCENDING
+from pymongo import Connection, ASCENDING, auth
 from pymongo.cursor import Cursor
+from pymongo.errors import CursorNotFound, OperationFailure
 from pymongo.database import Database
+from pymongo.pool import Pool
 from pymongo.collection import Collection
-from pymongo.son_manipulator import (SONManipulator, AutoReference,
-                                     NamespaceInjector)
+from pymongo.son_manipulator import SONManipulator
 
 
 # list of collections for models witch need autoincrement id
 inc_collections = set([])
 
+# list of non abstract models with collections, to manage their indexes
+registered_models = []
+
 after_insert = 'after_insert'
 after_update = 'after_update'
 after_delete = 'after_delete'
@@ -44,12 +64,147 @@ signal_map = {after_insert: _signals.signal('mongo_after_insert'),
               after_update: _signals.signal('mongo_after_update'),
               after_delete: _signals.signal('mongo_after_delete')}
 
+# cached collection sizes: {collection full name: (count, expiration time)}
+_count_cache = {}
+
+logger = logging.getLogger('flask_mongoset')
+
+# keeps current UnitOfWork of MongoSet.session_scope for the thread
+_local = threading.local()
+
+# number of queries without the shard key of sharded models:
+# {(model name, operation): count}
+untargeted_queries = {}
+
+# key tables shared by frozen documents with the same fields, least
+# recently used ones are dropped above the size:
+# {sorted keys: (sorted keys, {key: index})}
+_key_tables = OrderedDict()
+_key_tables_size = 1024
+_key_tables_lock = threading.Lock()
+
 
 def resolve_class(class_path):
     module_name, class_name = class_path.rsplit('.', 1)
     return getattr(import_module(module_name), class_name)
 
 
+def query_shape(spec):
+    """ Returns hashable shape of query :spec: - its fields and operators
+        without values
+    """
+    if isinstance(spec, dict):
+        return tuple(sorted((key, query_shape(value))
+                            for key, value in spec.iteritems()))
+    if isinstance(spec, (list, tuple)):
+        return tuple(query_shape(value) for value in spec
+                     if isinstance(value, dict))
+    return None
+
+
+def query_fields(spec):
+    """ Returns list of fields used in query :spec:
+    """
+    fields = []
+    for key, value in spec.iteritems():
+        if key in ('$and', '$or', '$nor'):
+            for clause in value:
+                fields.extend(query_fields(clause))
+        elif not key.startswith('$'):
+            fields.append(key)
+    return fields
+
+
+# query operators supported by _matches:
+_match_operators = {'$eq': operator.eq, '$ne': operator.ne,
+                    '$gt': operator.gt, '$gte': operator.ge,
+                    '$lt': operator.lt, '$lte': operator.le,
+                    '$in': lambda value, values: value in values,
+                    '$nin': lambda value, values: value not in values}
+
+
+def _matches(value, condition):
+    """ Checks if :value: matches :condition: of `$pull` update,
+        supports only equality and comparison operators
+    """
+    if not isinstance(condition, dict):
+        return value == condition
+    if any(key.startswith('$') for key in condition):
+        return all(_match_operators[key](value, expected)
+                   for key, expected in condition.iteritems())
+    return isinstance(value, dict) and all(
+        _matches(value.get(key), expected)
+        for key, expected in condition.iteritems())
+
+
+def _evaluable(condition):
+    """ Checks if :func:`_matches` supports all operators of :condition:
+    """
+    if not isinstance(condition, dict):
+        return True
+    if any(key.startswith('$') for key in condition):
+        return all(key in _match_operators for key in condition)
+    return all(_evaluable(value) for value in condition.itervalues())
+
+
+def send_signal(signal, sender, **kwargs):
+    """ Sends :signal: from :signal_map: with `signal` argument
+    """
+    with Stage('signals'):
+        return signal_map[signal].send(sender, signal=signal, **kwargs)
+
+
+def current_unit_of_work():
+    """ Returns :class:`UnitOfWork` of current :meth:`MongoSet.session_scope`
+        or None
+    """
+    return getattr(_local, 'unit_of_work', None)
+
+
+def merge_updates(first, second):
+    """ Returns one update document with changes of :first: and :second:
+        update documents, or None if they can't be merged
+    """
+    if not all(key.startswith('$') for key in first.keys() + second.keys()):
+        return None
+
+    merged = copy.deepcopy(first)
+    paths = dict((path, operator_name) for operator_name, fields in
+                 first.iteritems() for path in fields)
+    for operator_name, fields in second.iteritems():
+        for path, value in fields.iteritems():
+            if any(other.startswith(path + '.') or path.startswith(other + '.')
+                   for other in paths):
+                return None
+
+            if path in paths:
+                current = merged[paths[path]][path]
+                if paths[path] != operator_name:
+                    return None
+                elif operator_name == '$inc':
+                    value = current + value
+                elif operator_name in ('$min', '$max'):
+                    value = (operator_name == '$min' and min or max)(current,
+                                                                      value)
+                elif operator_name not in ('$set', '$unset'):
+                    return None
+
+            merged.setdefault(operator_name, {})[path] = value
+            paths[path] = operator_name
+    return merged
+
+
+def get_path(document, path):
+    """ Returns value of dotted :path: from :document: (dict or
+        :class:`FrozenDocument`) or None
+    """
+    for attr in path.split('.'):
+        if not isinstance(document, (dict, FrozenDocument)):
+            return None
+        document = document.get(attr)
+    return document
+
+
 class AuthenticationError(Exception):
     pass
 
@@ -58,6 +213,14 @@ class InitDataError(Exception):
     pass
 
 
+class InvalidTokenError(Exception):
+    pass
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
 class ClassProperty(property):
     """ Implements :@classproperty: decorator, like @property but
         for the class not for the instance of class
@@ -96,13 +259,18 @@ class AttrDict(dict):
     def __delattr__(self, attr):
         return self._change_method('__delitem__', attr)
 
-    def _make_attr_dict(self, value):
-        """ Supporting method for self.__setitem__
+    def _make_attr_dict(self, value, in_place=False):
+        """ Supporting method for self.__setitem__, lists are changed
+            in place if :in_place: is True
         """
         if isinstance(value, list):
-            value = map(self._make_attr_dict, value)
+            if not in_place:
+                return map(self._make_attr_dict, value)
+            for index, item in enumerate(value):
+                value[index] = self._make_attr_dict(item, True)
         elif isinstance(value, dict) and not isinstance(value, AttrDict):
-            value = AttrDict(value)
+            with Stage('wrap'):
+                value = AttrDict(value)
         return value
 
     def _change_method(self, method, *args, **kwargs):
@@ -120,6 +288,144 @@ class AttrDict(dict):
             setattr(self, key, value)
 
 
+def freeze(value):
+    """ Returns read-only compact copy of :value:, dicts are converted into
+        :class:`FrozenDocument` and lists into tuples
+    """
+    if isinstance(value, dict):
+        if isinstance(value, Model):
+            return FrozenDocument(value, value.__class__, value._lang)
+        model = value.get('_class') and resolve_class(value['_class'])
+        return FrozenDocument(value, model)
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class FrozenDocument(object):
+    """
+    Read-only compact representation of a document to keep large result
+    sets in memory, e.g. for caching. Values are kept in a tuple with
+    :attr:`__slots__`, and documents with the same fields share one key
+    table. Supports attribute and item access like :class:`AttrDict`,
+    translated fields of :model: are resolved for :lang: like
+    :class:`Model` does.
+
+    :param document: dict to freeze
+
+    :param model: optional, model class of the document
+
+    :param lang: optional, language, by default it is fallback language
+                of :model:
+    """
+    __slots__ = ('_table', '_values', '_model', '_lang')
+
+    def __init__(self, document, model=None, lang=None):
+        if model is not None and model._stored_names:
+            document = model._unalias(document)
+        keys = tuple(sorted(document))
+        with _key_tables_lock:
+            table = _key_tables.pop(keys, None)
+            if table is None:
+                table = (keys, dict((key, index) for index, key in
+                                    enumerate(keys)))
+                if len(_key_tables) >= _key_tables_size:
+                    _key_tables.popitem(last=False)
+            _key_tables[keys] = table
+        set_slot = object.__setattr__
+        set_slot(self, '_table', table)
+        set_slot(self, '_values', tuple(freeze(document[key])
+                                        for key in keys))
+        set_slot(self, '_model', model)
+        set_slot(self, '_lang', lang or model and model._fallback_lang)
+
+    def __getattr__(self, attr):
+        if attr in FrozenDocument.__slots__:
+            raise AttributeError(attr)
+        index = self._table[1].get(attr)
+        if index is None:
+            raise AttributeError(attr)
+        value = self._values[index]
+        if self._model and attr in self._model.i18n and \
+                isinstance(value, FrozenDocument):
+            if self._lang in value:
+                return value[self._lang]
+            value = value.get(self._model._fallback_lang, value)
+        return value
+
+    def __setattr__(self, attr, value):
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        index = self._table[1].get(key)
+        if index is None:
+            raise KeyError(key)
+        return self._values[index]
+
+    def __contains__(self, key):
+        return key in self._table[1]
+
+    def __iter__(self):
+        return iter(self._table[0])
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, FrozenDocument):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (self.__class__, (self.to_dict(), self._model, self._lang))
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.to_dict())
+
+    def get(self, key, default=None):
+        index = self._table[1].get(key)
+        return default if index is None else self._values[index]
+
+    def keys(self):
+        return list(self._table[0])
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._table[0], self._values)
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def to_dict(self):
+        """ Returns the document as dicts and lists
+        """
+        return dict((key, _thaw(value)) for key, value in self.items())
+
+    def to_model(self):
+        """ Returns mutable instance of :model: or :class:`AttrDict`
+        """
+        if self._model is None:
+            return AttrDict(self.to_dict())
+        return self._model(self.to_dict(), _lang=self._lang, from_db=True)
+
+
+def _thaw(value):
+    if isinstance(value, FrozenDocument):
+        return value.to_dict()
+    if isinstance(value, tuple):
+        return map(_thaw, value)
+    return value
+
+
 class AutoincrementId(SONManipulator):
     """ Creates objects id as integer and autoincrement it,
         if "id" not in son object.
@@ -153,25 +459,39 @@ class SavedObject(SONManipulator):
     TODO: this only works for documents that are in the same database. To fix
     this we'll need to add a DatabaseInjector that adds `_db` and then make
     use of the optional `database` support for DBRefs.
+
+    Documents are converted in place, that is safe for documents which
+    were just decoded by pymongo, set :in_place: to False if outgoing
+    documents may be shared.
     """
+    in_place = True
 
     def will_copy(self):
-        return True
+        return not self.in_place
 
     def _transform_value(self, value):
         if isinstance(value, list):
-            return map(self._transform_value, value)
+            return self._transform_list(value)
 
         if isinstance(value, dict):
             if value.get('_class'):
                 cls = resolve_class(value['_class'])
-                return cls(self._transform_dict(value))
+                return cls(self._transform_dict(value), from_db=True)
             return self._transform_dict(value)
 
         return value
 
+    def _transform_list(self, value):
+        if not self.in_place:
+            value = list(value)
+        for index, item in enumerate(value):
+            value[index] = self._transform_value(item)
+        return value
+
     def _transform_dict(self, object):
-        for (key, value) in object.items():
+        if not self.in_place:
+            object = copy.copy(object)
+        for (key, value) in object.iteritems():
             object[key] = self._transform_value(value)
         return object
 
@@ -179,26 +499,909 @@ class SavedObject(SONManipulator):
         return self._transform_value(son)
 
 
+class DocumentPipeline(SavedObject):
+    """ Transforms documents in one pass instead of the chain of
+        NamespaceInjector, AutoReference, AutoincrementId and SavedObject
+        manipulators, stages that collection doesn't need are skipped.
+
+        Incoming documents get `_ns` and `_int_id` (for models with
+        :inc_id:) in place. Embedded documents are replaced with DBRefs
+        by :attr:`references` stage if :autoref: is True and some model of
+        the collection uses autorefs, it has to be added to the database
+        too.
+
+        In outgoing documents DBRefs are dereferenced if :autoref: is True
+        and documents with `_class` are converted like :class:`SavedObject`
+        does, in place unless :in_place: is False.
+    """
+    def __init__(self, database, autoref=False, autoincrement=False,
+                 in_place=True):
+        self.database = database
+        self.in_place = in_place
+        self.autoref = autoref
+        self.autoincrement = autoincrement and AutoincrementId()
+        self.references = DocumentReferences(self)
+        # {collection name: if DBRefs are used}
+        self._autorefs = {}
+
+    def transform_incoming(self, son, collection):
+        with self._timer(collection, 'incoming'):
+            son['_ns'] = collection.name
+            if self.autoincrement and \
+                    collection.name in inc_collections and \
+                    '_int_id' not in son:
+                son['_int_id'] = self.autoincrement._get_next_id(collection)
+        return son
+
+    def transform_outgoing(self, son, collection):
+        with self._timer(collection, 'outgoing'):
+            return self._transform_value(son)
+
+    def _timer(self, collection, operation):
+        document_class = getattr(collection, 'document_class', None)
+        return Timer(Model._metrics, 'transform_seconds',
+                     document_class and document_class.__name__, operation)
+
+    def _transform_value(self, value):
+        if self.autoref and isinstance(value, DBRef):
+            return self.database.dereference(value)
+        return super(DocumentPipeline, self)._transform_value(value)
+
+    def _reference(self, value):
+        """ Returns copy of :value: with DBRefs instead of documents,
+            which were saved before
+        """
+        if isinstance(value, dict):
+            if '_id' in value and '_ns' in value:
+                return DBRef(value['_ns'], self._reference(value['_id']))
+            return self._reference_dict(value)
+        if isinstance(value, list):
+            return map(self._reference, value)
+        return value
+
+    def _reference_dict(self, son):
+        return dict((key, self._reference(value))
+                    for key, value in son.iteritems())
+
+    def _use_autorefs(self, collection):
+        if not self.autoref:
+            return False
+        name = collection.name
+        if name not in self._autorefs:
+            models = [model for model in registered_models
+                      if model.__collection__ == name]
+            self._autorefs[name] = not models or any(model.use_autorefs
+                                                     for model in models)
+        return self._autorefs[name]
+
+
+class DocumentReferences(SONManipulator):
+    """ Copying stage of :class:`DocumentPipeline` which replaces embedded
+        documents with DBRefs, pymongo applies it after `_id` is set,
+        so the `_id` is added to the document of the caller
+    """
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+    def will_copy(self):
+        return True
+
+    def transform_incoming(self, son, collection):
+        pipeline = self.pipeline
+        if not pipeline._use_autorefs(collection):
+            return son
+        with pipeline._timer(collection, 'incoming'):
+            return pipeline._reference_dict(son)
+
+
 class MongoCursor(Cursor):
     """
     A cursor that will return an instance of :as_class: parameter with
-    provided :_lang: parameter instead of dict type
+    provided :_lang: parameter instead of dict type, or
+    :class:`FrozenDocument` if :frozen: is True.
+    If :lazy: is True SON manipulators aren't applied to documents,
+    fields of instances are converted on first access.
+    If :translations: collection is passed, translated fields of each
+    fetched batch of documents are loaded from it with one query, see
+    :attr:`Model.i18n_collection`
     """
     def __init__(self, *args, **kwargs):
         self._lang = kwargs.pop('_lang')
         self.as_class = kwargs.pop('as_class')
+        self.frozen = kwargs.pop('frozen', False)
+        self.lazy = kwargs.pop('lazy', False)
+        self.translations = kwargs.pop('translations', None)
+        # documents of the current batch with loaded translations
+        self._page = deque()
+        # class to decode documents into by pymongo:
+        kwargs['as_class'] = kwargs.pop('son_class', None)
         super(MongoCursor, self).__init__(*args, **kwargs)
 
     def next(self):
-        data = super(MongoCursor, self).next()
-        return self.as_class(data, _lang=self._lang, from_db=True)
+        if self.translations is None:
+            data = super(MongoCursor, self).next()
+        else:
+            self._page or self._page.extend(self._translate_page())
+            data = self._page.popleft()
+        return self._make_instance(data)
+
+    def rewind(self):
+        self._page.clear()
+        return super(MongoCursor, self).rewind()
+
+    def sort(self, key_or_list, direction=None):
+        """ Sorts by stored names of fields with :attr:`Model.aliases`
+        """
+        aliases = getattr(self.as_class, 'aliases', None)
+        if aliases:
+            if isinstance(key_or_list, basestring):
+                key_or_list = self.collection._alias_key(key_or_list)
+            else:
+                key_or_list = [(self.collection._alias_key(key), value)
+                               for key, value in key_or_list]
+        return super(MongoCursor, self).sort(key_or_list, direction)
+
+    def _refresh(self):
+        """ Observes round trips and counts fetched documents in
+            :attr:`Model._metrics` if it is set, see :class:`Timer`
+        """
+        # nothing is sent for buffered, killed or exhausted cursors
+        if self._Cursor__data or self._Cursor__killed or \
+                self._Cursor__id == 0:
+            return super(MongoCursor, self)._refresh()
+        metrics = self.as_class._metrics
+        name = self.as_class.__name__
+        with Timer(metrics, 'operation_seconds', name, 'find'):
+            count = super(MongoCursor, self)._refresh()
+        metrics is not None and metrics.inc('documents_read', name, 'find',
+                                            count)
+        return count
+
+    def _translate_page(self):
+        """ Returns documents of the current batch with translated fields
+            in :_lang: and fallback language loaded from :translations:
+        """
+        fetch = super(MongoCursor, self).next
+        documents = [fetch()]
+        # the rest of the batch is already received, so it's taken
+        # without round trips
+        while self._Cursor__data:
+            documents.append(fetch())
+
+        by_id = dict((document['_id'], document) for document in documents)
+        langs = list(set([self._lang, self.as_class._fallback_lang]))
+        spec = {'doc': {'$in': by_id.keys()}, 'lang': {'$in': langs}}
+        for son in self.translations.find(spec, as_class=AttrDict,
+                                          manipulate=False):
+            document = by_id[son.pop('doc')]
+            lang = son.pop('lang')
+            del son['_id']
+            for attr, value in son.iteritems():
+                document.setdefault(attr, AttrDict())[lang] = value
+        return documents
 
     def __getitem__(self, index):
         item = super(MongoCursor, self).__getitem__(index)
         if isinstance(index, slice):
             return item
         else:
-            return self.as_class(item, _lang=self._lang, from_db=True)
+            return self._make_instance(item)
+
+    def _make_instance(self, data):
+        """ Returns instance of :as_class:, documents already converted
+            by SavedObject are returned as they are
+        """
+        if self.frozen:
+            return FrozenDocument(data, self.as_class, self._lang)
+        if self.lazy:
+            return self.as_class(data, _lang=self._lang, from_db=True,
+                                 lazy=True)
+        if isinstance(data, self.as_class):
+            data._lang = self._lang
+            return data
+        return self.as_class(data, _lang=self._lang, from_db=True)
+
+    def _clone_base(self):
+        """ Keeps :as_class:, :_lang:, :frozen:, :lazy: and
+            :translations: for cloned cursors
+        """
+        return self.__class__(self.collection, _lang=self._lang,
+                              as_class=self.as_class, frozen=self.frozen,
+                              lazy=self.lazy, translations=self.translations)
+
+    def stream(self, batch_size=100, chunk=None, raw=False):
+        """ Yields lists of documents instead of single documents, so only
+            one list is kept in memory at a time
+
+            :param batch_size: number of documents the server returns
+                        per round trip
+
+            :param chunk: length of yielded lists, by default it is
+                        the same as :param batch_size:
+
+            :param raw: if it is True - documents are yielded as they come
+                        from pymongo, without :as_class: instantiation
+        """
+        self.batch_size(batch_size)
+        chunk = chunk or batch_size
+        fetch = raw and super(MongoCursor, self).next or self.next
+        documents = []
+        while True:
+            try:
+                documents.append(fetch())
+            except StopIteration:
+                break
+            if len(documents) == chunk:
+                yield documents
+                documents = []
+        if documents:
+            yield documents
+
+
+class QueryInspector(object):
+    """ Runs `explain` for a sample of query shapes and reports queries that
+        scan the whole collection or examine much more documents than
+        they return, with the fields that aren't covered by declared indexes
+
+    :param sample_rate: part of not inspected query shapes to explain,
+                from 0 to 1
+
+    :param selectivity: examined to returned documents ratio, queries with
+                greater ratio are reported
+
+    :param languages: languages of translated indexes,
+                see :meth:`BaseQuery.declared_indexes`
+    """
+    def __init__(self, sample_rate=1.0, selectivity=10, languages=(),
+                 max_reports=100):
+        self.sample_rate = sample_rate
+        self.selectivity = selectivity
+        self.languages = languages
+        self.inspected = set()
+        self.reports = deque(maxlen=max_reports)
+
+    def inspect(self, query, operation, spec):
+        shape = (query.full_name, operation, query_shape(spec))
+        if shape in self.inspected or random.random() >= self.sample_rate:
+            return
+        self.inspected.add(shape)
+
+        explain = Collection.find(query, spec, manipulate=False).explain()
+        collscan, examined, returned = self._parse_explain(explain)
+        if not collscan and examined <= self.selectivity * max(returned, 1):
+            return
+
+        leading = set(['_id'])
+        leading.update(key[0][0] for key, options in
+                       query.declared_indexes(self.languages))
+        report = {'model': query.document_class.__name__,
+                  'operation': operation,
+                  'spec': spec,
+                  'collscan': collscan,
+                  'examined': examined,
+                  'returned': returned,
+                  'unindexed': [field for field in query_fields(spec)
+                                if field not in leading]}
+        self.reports.append(report)
+        logger.warning("%(model)s.%(operation)s examined %(examined)s "
+                       "documents to return %(returned)s "
+                       "(collection scan: %(collscan)s, fields without "
+                       "declared indexes: %(unindexed)s), spec: %(spec)s",
+                       report)
+
+    def _parse_explain(self, explain):
+        """ Returns (collection scan, examined, returned) from explain output
+            of MongoDB < 3.0 and >= 3.0
+        """
+        if 'queryPlanner' in explain:
+            stats = explain.get('executionStats', {})
+            plans = [explain['queryPlanner']['winningPlan']]
+            collscan = False
+            while plans:
+                plan = plans.pop()
+                collscan = collscan or plan.get('stage') == 'COLLSCAN'
+                plans.extend(plan.get('inputStages', []))
+                'inputStage' in plan and plans.append(plan['inputStage'])
+            return (collscan, stats.get('totalDocsExamined', 0),
+                    stats.get('nReturned', 0))
+
+        clauses = explain.get('clauses', [explain])
+        collscan = any(clause.get('cursor', '').startswith('BasicCursor')
+                       for clause in clauses)
+        return (collscan, explain.get('nscannedObjects',
+                                      explain.get('nscanned', 0)),
+                explain.get('n', 0))
+
+
+class Metrics(object):
+    """ Collects metrics of operations by model and operation and renders
+        them in Prometheus text format, see :meth:`render`.
+        Durations are observed into histograms: `operation_seconds`
+        (writes and round trips of cursors), `transform_seconds`
+        (SON manipulators), `validation_seconds` (check of
+        :attr:`Model.structure`) and `pool_wait_seconds` (socket
+        checkout), counters are
+        `documents_read`, `documents_written`, `bytes_sent` and
+        `bytes_received`.
+
+        Any object with :meth:`observe` and :meth:`inc` methods could be
+        used instead to pass the metrics to another collector.
+
+    :param buckets: upper bounds of histogram buckets in seconds
+    """
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+               0.5, 1, 2.5, 5)
+
+    def __init__(self, buckets=None, prefix='mongoset'):
+        self.buckets = tuple(sorted(buckets or self.buckets))
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # {(name, model, operation): [count of each bucket, ..., sum]}
+        self.histograms = {}
+        # {(name, model, operation): value}
+        self.counters = {}
+
+    def observe(self, name, model, operation, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            histogram = self.histograms.get((name, model, operation))
+            if histogram is None:
+                histogram = [0] * (len(self.buckets) + 2)
+                self.histograms[(name, model, operation)] = histogram
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def inc(self, name, model, operation, value=1):
+        with self.lock:
+            key = (name, model, operation)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        """ Returns the metrics in Prometheus text exposition format
+        """
+        with self.lock:
+            histograms = sorted((key, list(value)) for key, value in
+                                self.histograms.iteritems())
+            counters = sorted(self.counters.iteritems())
+
+        lines = []
+        previous = None
+        bounds = [repr(float(bound)) for bound in self.buckets] + ['+Inf']
+        for (name, model, operation), histogram in histograms:
+            name = '{}_{}'.format(self.prefix, name)
+            labels = self._labels(model, operation)
+            if name != previous:
+                lines.append('# TYPE {} histogram'.format(name))
+                previous = name
+            count = 0
+            for bound, value in zip(bounds, histogram):
+                count += value
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    name, labels, bound, count))
+            lines.append('{}_sum{{{}}} {!r}'.format(name, labels,
+                                                    histogram[-1]))
+            lines.append('{}_count{{{}}} {}'.format(name, labels, count))
+
+        for (name, model, operation), value in counters:
+            name = '{}_{}_total'.format(self.prefix, name)
+            if name != previous:
+                lines.append('# TYPE {} counter'.format(name))
+                previous = name
+            lines.append('{}{{{}}} {}'.format(
+                name, self._labels(model, operation), value))
+        return '\n'.join(lines) + '\n'
+
+    def _labels(self, model, operation):
+        return 'model="{}",operation="{}"'.format(model or '', operation)
+
+
+class Profiler(object):
+    """ Attributes time spent in the extension during a request to stages:
+        `init` (:meth:`Model.__init__`), `wrap` (:class:`AttrDict`
+        wrapping), `validation` (check of :attr:`Model.structure`),
+        `insert_lang` (:meth:`BaseQuery._insert_lang`), `transform`
+        (SON manipulators), `signals` and `network` (round trips).
+        Time of nested stages isn't counted in the outer ones.
+
+    :param name: name of the profiled request
+    """
+    def __init__(self, name=None):
+        self.name = name
+        self.start = time.time()
+        # [[stage, start, time of nested stages], ...]
+        self.stack = []
+        # {stage: [seconds, calls]}
+        self.stages = {}
+
+    def enter(self, stage):
+        self.stack.append([stage, time.time(), 0.0])
+
+    def exit(self):
+        stage, start, nested = self.stack.pop()
+        elapsed = time.time() - start
+        totals = self.stages.setdefault(stage, [0.0, 0])
+        totals[0] += elapsed - nested
+        totals[1] += 1
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def report(self):
+        """ Returns {'name': name, 'total': seconds, 'stages': {stage:
+            [seconds, calls]}}, time outside the stages is `other`
+        """
+        total = time.time() - self.start
+        stages = dict((stage, list(totals)) for stage, totals in
+                      self.stages.iteritems())
+        stages['other'] = [total - sum(seconds for seconds, calls in
+                                       self.stages.itervalues()), 1]
+        return {'name': self.name, 'total': total, 'stages': stages}
+
+
+def format_profile(report):
+    """ Returns :meth:`Profiler.report` in one line, e.g.
+        `GET /items 12.1ms: network 8.0ms/3, init 2.1ms/40, other 2.0ms/1`
+    """
+    stages = sorted(report['stages'].iteritems(),
+                    key=lambda item: -item[1][0])
+    return '{} {:.1f}ms: {}'.format(
+        report['name'], report['total'] * 1000,
+        ', '.join('{} {:.1f}ms/{}'.format(stage, seconds * 1000, calls)
+                  for stage, (seconds, calls) in stages))
+
+
+def current_profiler():
+    return getattr(_local, 'profiler', None)
+
+
+class Stage(object):
+    """ Context manager attributing time of the block to :stage: of
+        the :class:`Profiler` of the current thread, does nothing if
+        the thread isn't profiled
+    """
+    __slots__ = ('stage', 'profiler')
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.profiler = getattr(_local, 'profiler', None)
+
+    def __enter__(self):
+        if self.profiler is not None:
+            self.profiler.enter(self.stage)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.profiler is not None:
+            self.profiler.exit()
+
+
+class Timer(Stage):
+    """ Context manager observing duration of the block into :metrics:
+        histogram :name: and the current :class:`Profiler`, does nothing
+        if :metrics: is None and the thread isn't profiled.
+        The model and operation are kept for the current thread during
+        the block, so pool waits and bytes are counted for them.
+    """
+    __slots__ = ('metrics', 'name', 'labels', 'outer', 'start')
+
+    # {histogram name: profiler stage}
+    stages = {'operation_seconds': 'network',
+              'transform_seconds': 'transform',
+              'validation_seconds': 'validation'}
+
+    def __init__(self, metrics, name, model, operation):
+        super(Timer, self).__init__(self.stages[name])
+        self.metrics = metrics
+        self.name = name
+        self.labels = (model, operation)
+
+    def __enter__(self):
+        super(Timer, self).__enter__()
+        if self.metrics is not None:
+            self.outer = getattr(_local, 'labels', None)
+            _local.labels = self.labels
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.metrics is not None:
+            self.metrics.observe(self.name, self.labels[0], self.labels[1],
+                                 time.time() - self.start)
+            _local.labels = self.outer
+        super(Timer, self).__exit__(*exc_info)
+
+
+def current_labels():
+    """ Returns (model, operation) of the operation running in
+        the current thread
+    """
+    return getattr(_local, 'labels', None) or (None, 'other')
+
+
+class MetricsPool(Pool):
+    """ Pool which observes socket checkout time into `pool_wait_seconds`
+    """
+    def get_socket(self, force=False):
+        # Pool is an old-style class
+        metrics = Model._metrics
+        if metrics is None:
+            return Pool.get_socket(self, force)
+        start = time.time()
+        sock_info = Pool.get_socket(self, force)
+        model, operation = current_labels()
+        metrics.observe('pool_wait_seconds', model, operation,
+                        time.time() - start)
+        return sock_info
+
+
+class QueryBudget(object):
+    """ Counts messages sent to MongoDB in the current thread, including
+        dereferences of DBRefs and autoincrement counters, and documents
+        returned by the server. If there are more than :max_queries:
+        messages or :max_docs: documents :class:`QueryBudgetExceeded`
+        is raised, or a warning is logged once if :warn: is True.
+        Nested budgets are counted in the outer ones too, a budget can't
+        be entered again until it exits.
+
+        It is a context manager or a decorator::
+
+            with QueryBudget(max_queries=3):
+                products = list(Product.query.find())
+
+            @QueryBudget(max_queries=3)
+            def view():
+                ...
+
+    :param name: name of the checked code in the message
+    """
+    def __init__(self, max_queries=None, max_docs=None, warn=False,
+                 name=None):
+        self.max_queries = max_queries
+        self.max_docs = max_docs
+        self.warn = warn
+        self.name = name
+        self.queries = 0
+        self.documents = 0
+        self.warned = False
+        self.outer = None
+        self.active = False
+
+    def __enter__(self):
+        if self.active:
+            raise RuntimeError("{} query budget is already entered"
+                               .format(self.name or 'The'))
+        self.active = True
+        self.queries = self.documents = 0
+        self.warned = False
+        self.outer = current_budget()
+        _local.budget = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _local.budget = self.outer
+        self.outer = None
+        self.active = False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with QueryBudget(self.max_queries, self.max_docs, self.warn,
+                             self.name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def charge(self, documents=0):
+        """ Counts one message with :documents: returned in this and
+            the outer budgets
+        """
+        budget = self
+        while budget is not None:
+            budget.queries += 1
+            budget.documents += documents
+            budget._check()
+            budget = budget.outer
+
+    def _check(self):
+        if (self.max_queries is None or self.queries <= self.max_queries) \
+                and (self.max_docs is None or
+                     self.documents <= self.max_docs):
+            return
+        message = "{} exceeded query budget: {} queries (max {}), " \
+            "{} documents (max {})".format(
+                self.name or 'Code', self.queries, self.max_queries,
+                self.documents, self.max_docs)
+        if not self.warn:
+            raise QueryBudgetExceeded(message)
+        if not self.warned:
+            self.warned = True
+            logger.warning(message)
+
+
+def current_budget():
+    return getattr(_local, 'budget', None)
+
+
+class MongoConnection(Connection):
+    """ Connection which counts messages in :class:`QueryBudget` of
+        the current thread and bytes of sent and received messages in
+        :attr:`Model._metrics`
+    """
+    def _send_message(self, message, *args, **kwargs):
+        budget = current_budget()
+        budget is not None and budget.charge()
+        metrics = Model._metrics
+        if metrics is not None:
+            model, operation = current_labels()
+            metrics.inc('bytes_sent', model, operation, len(message[1]))
+        return super(MongoConnection, self)._send_message(message, *args,
+                                                          **kwargs)
+
+    def _send_message_with_response(self, message, *args, **kwargs):
+        result = super(MongoConnection, self)._send_message_with_response(
+            message, *args, **kwargs)
+        response = result[1][0]
+        budget = current_budget()
+        if budget is not None:
+            # numberReturned field of OP_REPLY
+            budget.charge(struct.unpack('<i', response[16:20])[0])
+        metrics = Model._metrics
+        if metrics is not None:
+            model, operation = current_labels()
+            metrics.inc('bytes_sent', model, operation, len(message[1]))
+            metrics.inc('bytes_received', model, operation, len(response))
+        return result
+
+
+class Page(object):
+    """ One page of :meth:`BaseQuery.paginate` results
+
+    :param items: list of documents
+
+    :param next_token: opaque token to request the next page with,
+                None for the last page
+
+    :param total: number of matched documents, if it was requested
+    """
+    def __init__(self, items, next_token=None, total=None):
+        self.items = items
+        self.next_token = next_token
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_token is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Update(object):
+    """ Builder of update document with MongoDB operators for
+        :meth:`Model.update` and :meth:`BaseQuery.update_many`.
+        Nested fields could be passed in dicts or with double underscores
+        instead of dots::
+
+            Update().inc(views=1).push(tags='new').set(stats__rating=5)
+
+        :meth:`Model.update` applies the changes to the instance after the
+        update, so it isn't needed to reload it, unless :meth:`applicable`
+        is False
+    """
+    # operators supported by :meth:`apply`
+    operators = frozenset(['$set', '$unset', '$inc', '$push', '$addToSet',
+                           '$pull', '$min', '$max'])
+
+    def __init__(self):
+        self.document = {}
+
+    def set(self, *args, **kwargs):
+        return self._add('$set', args, kwargs)
+
+    def unset(self, *fields):
+        return self._add('$unset', [dict.fromkeys(fields, '')], {})
+
+    def inc(self, *args, **kwargs):
+        return self._add('$inc', args, kwargs)
+
+    def push(self, *args, **kwargs):
+        return self._add('$push', args, kwargs)
+
+    def add_to_set(self, *args, **kwargs):
+        return self._add('$addToSet', args, kwargs)
+
+    def pull(self, *args, **kwargs):
+        return self._add('$pull', args, kwargs)
+
+    def min(self, *args, **kwargs):
+        return self._add('$min', args, kwargs)
+
+    def max(self, *args, **kwargs):
+        return self._add('$max', args, kwargs)
+
+    def applicable(self):
+        """ Checks if :meth:`apply` supports all operators of the update:
+            `$each` is the only modifier of `$push` and `$addToSet`,
+            conditions of `$pull` use only equality and comparison operators
+        """
+        for operator_name, fields in self.document.iteritems():
+            if operator_name not in self.operators or \
+                    not isinstance(fields, dict):
+                return False
+            for value in fields.itervalues():
+                if operator_name in ('$push', '$addToSet') and \
+                        isinstance(value, dict) and \
+                        any(key.startswith('$') for key in value) and \
+                        set(value) != set(['$each']):
+                    return False
+                if operator_name == '$pull' and not _evaluable(value):
+                    return False
+        return True
+
+    def apply(self, document, i18n=(), lang=None):
+        """ Applies the update to :document:, paths of translated
+            attributes from :i18n: are changed for :lang:
+        """
+        for operator_name, fields in self.document.iteritems():
+            for path, value in fields.iteritems():
+                attrs = path.split('.')
+                if attrs[0] in i18n:
+                    attrs.insert(1, lang)
+                parent = document
+                for attr in attrs[:-1]:
+                    if not isinstance(parent.get(attr), dict):
+                        parent[attr] = AttrDict()
+                    parent = parent[attr]
+                self._apply_operator(operator_name, parent, attrs[-1], value)
+
+    def _apply_operator(self, operator_name, parent, name, value):
+        if operator_name == '$unset':
+            parent.pop(name, None)
+            return
+
+        if operator_name in ('$push', '$addToSet'):
+            items = list(parent.get(name) or [])
+            values = [value]
+            if isinstance(value, dict) and '$each' in value:
+                values = value['$each']
+            for item in values:
+                if operator_name == '$push' or item not in items:
+                    items.append(item)
+            value = items
+        elif operator_name == '$pull':
+            value = [item for item in parent.get(name) or []
+                     if not _matches(item, value)]
+        elif operator_name == '$inc':
+            value = parent.get(name, 0) + value
+        elif operator_name in ('$min', '$max') and name in parent:
+            value = (operator_name == '$min' and min or max)(parent[name],
+                                                              value)
+        parent[name] = AttrDict()._make_attr_dict(value)
+
+    def _add(self, operator_name, args, kwargs):
+        fields = self.document.setdefault(operator_name, {})
+        for dct in args:
+            fields.update(dct)
+        fields.update((key.replace('__', '.'), value)
+                      for key, value in kwargs.iteritems())
+        return self
+
+
+class Aggregation(object):
+    """ Builder of aggregation pipeline, returned by
+        :meth:`BaseQuery.aggregate`. Paths of translated attributes are
+        rewritten for :param lang: like in :meth:`BaseQuery.find` until
+        the documents are reshaped by `$group`, `$project` or `$facet`,
+        e.g. '$name' becomes '$name.en', aliased fields are renamed too.
+
+        Results are streamed via server cursor when the instance is iterated
+
+    :param as_model: if it is True - results are returned as instances
+                of the model
+
+    :param options: extra parameters of aggregate command,
+                e.g. allowDiskUse=True
+    """
+    def __init__(self, query, lang, as_model=False, **options):
+        self.query = query
+        self.lang = lang
+        self.as_model = as_model
+        self.options = options
+        self.pipeline = []
+        self.translated = bool(query.i18n or query.aliases)
+
+    def match(self, spec):
+        spec = copy.deepcopy(spec)
+        if self.translated:
+            spec = self.query._insert_lang(spec, self.lang)
+        return self._add('$match', spec)
+
+    def group(self, spec):
+        spec = self._translate(spec)
+        self.translated = False
+        return self._add('$group', spec)
+
+    def project(self, spec):
+        if self.translated:
+            projection = {}
+            for key, value in spec.iteritems():
+                # included translated field becomes value of the language:
+                if value in (1, True) and self._translate_key(key) != key:
+                    value = '$' + key
+                projection[key] = self._translate(value)
+            spec = projection
+        self.translated = False
+        return self._add('$project', spec)
+
+    def sort(self, key_or_list, direction=ASCENDING):
+        if isinstance(key_or_list, basestring):
+            key_or_list = [(key_or_list, direction)]
+        return self._add('$sort', SON((self._translate_key(key), direction)
+                                      for key, direction in key_or_list))
+
+    def limit(self, limit):
+        return self._add('$limit', limit)
+
+    def skip(self, skip):
+        return self._add('$skip', skip)
+
+    def unwind(self, path):
+        return self._add('$unwind', self._translate(path))
+
+    def facet(self, **facets):
+        """ :param facets: pipelines by output field names, lists of stages
+                    or :class:`Aggregation` instances
+        """
+        facets = dict((name, isinstance(pipeline, Aggregation) and
+                       pipeline.pipeline or pipeline)
+                      for name, pipeline in facets.iteritems())
+        self.translated = False
+        return self._add('$facet', facets)
+
+    def all(self):
+        return list(self)
+
+    def __iter__(self):
+        result = Collection.aggregate(self.query, self.pipeline, cursor={},
+                                      **self.options)
+        if isinstance(result, dict):
+            result = result['result']
+
+        if not self.as_model:
+            return iter(result)
+
+        document_class = self.query.document_class
+        database = self.query.database
+        return (document_class(database._fix_outgoing(son, self.query),
+                               _lang=self.lang, from_db=True)
+                for son in result)
+
+    def _add(self, stage, spec):
+        self.pipeline.append({stage: spec})
+        return self
+
+    def _translate_key(self, key):
+        if not self.translated:
+            return key
+        return self.query._alias_key(self.query._lang_key(key, self.lang))
+
+    def _translate(self, expression):
+        """ Rewrites field paths ('$field') of translated attributes
+            in the :expression:
+        """
+        if not self.translated:
+            return expression
+        if isinstance(expression, dict):
+            return dict((key, self._translate(value))
+                        for key, value in expression.iteritems())
+        if isinstance(expression, list):
+            return map(self._translate, expression)
+        if isinstance(expression, basestring) and \
+                expression.startswith('$') and \
+                not expression.startswith('$$'):
+            return '$' + self._translate_key(expression[1:])
+        return expression
 
 
 class BaseQuery(Collection):
@@ -213,84 +1416,696 @@ class BaseQuery(Collection):
     :param i18n: to change translatable attributes in the search query
     """
 
+    # seconds to keep result of :meth:`estimated_count`
+    count_cache_timeout = 60
+
+    # class to decode documents into by pymongo, with AttrDict embedded
+    # documents don't need to be wrapped again by Model
+    son_class = AttrDict
+
     def __init__(self, *args, **kwargs):
         self.document_class = kwargs.pop('document_class')
         self.i18n = getattr(self.document_class, 'i18n', None)
+        self.aliases = getattr(self.document_class, 'aliases', None) or {}
         super(BaseQuery, self).__init__(*args, **kwargs)
 
     def find(self, *args, **kwargs):
         spec = args and args[0]
         kwargs['as_class'] = self.document_class
+        kwargs.setdefault('son_class', self.son_class)
         kwargs['_lang'] = lang = kwargs.pop('_lang',
                                             self.document_class._fallback_lang)
+        if kwargs.get('lazy'):
+            kwargs['manipulate'] = False
 
-        # defines the fields that should be translated
-        if self.i18n and spec:
+        # defines the fields that should be translated or renamed
+        if (self.i18n or self.aliases) and spec:
             if not isinstance(spec, dict):
                 raise TypeError("The first argument must be an instance of "
                                 "dict")
 
-            spec = self._insert_lang(spec, lang)
-
+            spec = self._translate_spec(spec, lang)
+            args = (spec,) + args[1:]
+
+        if self.document_class.i18n_collection:
+            fields = args[1:2] and args[1] or kwargs.get('fields')
+            if not fields or any(name.split('.')[0] in self.i18n
+                                 for name in fields):
+                kwargs['translations'] = self._translations()
+
+        if self.aliases:
+            if args[1:2] and args[1]:
+                args = args[:1] + (self._alias_fields(args[1]),) + args[2:]
+            elif kwargs.get('fields'):
+                kwargs['fields'] = self._alias_fields(kwargs['fields'])
+            if kwargs.get('sort'):
+                kwargs['sort'] = [(self._alias_key(key), direction)
+                                  for key, direction in kwargs['sort']]
+
+        self._inspect('find', spec)
         return MongoCursor(self, *args, **kwargs)
 
+    def stream(self, spec=None, batch_size=100, chunk=None, raw=False,
+               after=None, retries=3, **kwargs):
+        """ Iterates over documents matched by :spec: in `_id` order and
+            yields them in lists, see :meth:`MongoCursor.stream`.
+            If the server cursor is lost (e.g. timed out) the query is
+            restarted from the last yielded `_id`, at most :retries: times.
+
+            :param after: `_id` to resume an interrupted iteration after
+
+            :param raw: if it is True - documents are yielded as plain
+                        dicts, without SON manipulators
+        """
+        kwargs['sort'] = [('_id', ASCENDING)]
+        if raw:
+            kwargs['manipulate'] = False
+
+        while True:
+            query = copy.deepcopy(spec or {})
+            if after is not None:
+                query = {'$and': [query, {'_id': {'$gt': after}}]}
+
+            cursor = self.find(query, **kwargs)
+            try:
+                for documents in cursor.stream(batch_size, chunk, raw):
+                    after = documents[-1]['_id']
+                    yield documents
+                return
+            except CursorNotFound:
+                if not retries:
+                    raise
+                retries -= 1
+
     def insert(self, doc_or_docs, manipulate=True,
                safe=None, check_keys=True, continue_on_error=False, **kwargs):
-        """ Overrided method for sending :after_insert: signal
+        """ Overrided method for sending :after_insert: signal,
+            translated fields are saved into :attr:`Model.i18n_collection`
+            if it is set, fields are stored with :attr:`Model.aliases`
         """
-        _id = super(BaseQuery, self).insert(doc_or_docs, manipulate, safe,
-                                            check_keys, continue_on_error,
-                                            **kwargs)
-        signal_map[after_insert].send(self.document_class.__name__, _id=_id,
-                                      collection=self, signal=after_insert)
+        translations = []
+        if self.document_class.i18n_collection or self.aliases:
+            docs = isinstance(doc_or_docs, dict) and [doc_or_docs] or \
+                doc_or_docs
+            documents = []
+            for doc in docs:
+                doc.setdefault('_id', ObjectId())
+                document = doc
+                if self.document_class.i18n_collection:
+                    document, translated = self._split_translations(doc)
+                    translations.append((doc['_id'], translated))
+                documents.append(self._alias_document(document))
+            doc_or_docs = doc_or_docs is docs and documents or documents[0]
+
+        with self._timer('insert'):
+            _id = super(BaseQuery, self).insert(doc_or_docs, manipulate,
+                                                safe, check_keys,
+                                                continue_on_error, **kwargs)
+        self._count_written('insert', isinstance(_id, list) and len(_id) or 1)
+        for doc_id, translated in translations:
+            self._save_translations(doc_id, translated)
+        send_signal(after_insert, self.document_class.__name__, _id=_id,
+                    collection=self)
         return _id
 
-    def update(self, spec, document, **kwargs):
-        if self.i18n:
-            lang = kwargs.pop('_lang')
-            for attr, value in document.items():
-                if attr.startswith('$'):
-                    document[attr] = self._insert_lang(value, lang)
-                else:
-                    document[attr] = {lang: value}
+    def save(self, to_save, manipulate=True, safe=None, check_keys=True,
+             **kwargs):
+        """ Overrided method: :meth:`Collection.save` passes positional
+            arguments to :meth:`update`, existing documents are replaced
+            here and :after_update: signal is sent
+        """
+        if '_id' not in to_save:
+            return self.insert(to_save, manipulate, safe, check_keys,
+                               **kwargs)
+
+        kwargs.pop('_lang', None)
+        document, translated = to_save, None
+        if self.document_class.i18n_collection:
+            document, translated = self._split_translations(to_save)
+        document = self._alias_document(document)
+        spec = self._alias_spec(self._shard_spec(to_save['_id'], to_save))
+        self._inspect('update', spec)
+        with self._timer('save'):
+            Collection.update(self, spec, document, upsert=True,
+                              manipulate=manipulate, safe=safe,
+                              check_keys=check_keys, **kwargs)
+        self._count_written('save', 1)
+        translated and self._save_translations(to_save['_id'], translated)
+        send_signal(after_update, self.document_class.__name__,
+                    _id=to_save['_id'], collection=self)
+        return to_save['_id']
 
-        _id = spec.get('_id')
-        result = super(BaseQuery, self).update(spec, document, **kwargs)
-        signal_map[after_update].send(self.document_class.__name__, _id=_id,
-                                      collection=self, signal=after_update)
+    def update(self, spec, document, **kwargs):
+        result = self._update(self._alias_spec(spec), document, **kwargs)
+        send_signal(after_update, self.document_class.__name__,
+                    _id=spec.get('_id'), collection=self)
         return result
 
-    def remove(self, spec_or_id=None, safe=None, **kwargs):
-        signal_map[after_delete].send(self.document_class.__name__,
-                                      _id=spec_or_id, collection=self,
-                                      signal=after_delete)
-        return super(BaseQuery, self).remove(spec_or_id, safe, **kwargs)
+    def update_many(self, spec, document, collect_ids=False, **kwargs):
+        """ Updates all documents matched by :spec: with one query,
+            paths of translated attributes in :spec: and :document:
+            are changed for :_lang:. The :document: could be an instance
+            of :class:`Update`.
+
+            Sends one :after_update: signal with the :spec: and `ids` of
+            matched documents, if :collect_ids: is True they are fetched
+            before the update, otherwise `ids` is None.
+
+            Returns AttrDict with `matched_count`, `modified_count` and `ids`,
+            counts are None for unacknowledged writes
+        """
+        kwargs['multi'] = True
+        if self.i18n or self.aliases:
+            kwargs.setdefault('_lang', self.document_class._fallback_lang)
+            spec = self._translate_spec(copy.deepcopy(spec), kwargs['_lang'])
+
+        ids = collect_ids and self._collect_ids(spec) or None
+        result = self._update(spec, document, **kwargs) or {}
+        send_signal(after_update, self.document_class.__name__, _id=None,
+                    ids=ids, spec=spec, collection=self)
+        return AttrDict(matched_count=result.get('n'),
+                        modified_count=result.get('nModified'), ids=ids)
+
+    def delete_many(self, spec, collect_ids=False, **kwargs):
+        """ Removes all documents matched by :spec: with one query and sends
+            one :after_delete: signal like :meth:`update_many` does.
+
+            Returns AttrDict with `deleted_count` and `ids`
+        """
+        lang = kwargs.pop('_lang', self.document_class._fallback_lang)
+        if self.i18n or self.aliases:
+            spec = self._translate_spec(copy.deepcopy(spec), lang)
+
+        collect_ids = collect_ids or self.document_class.i18n_collection
+        ids = self._collect_ids(spec) if collect_ids else None
+        self._inspect('remove', spec)
+        with self._timer('remove'):
+            result = super(BaseQuery, self).remove(
+                self._collected_spec(spec, ids), multi=True, **kwargs) or {}
+        self._count_written('remove', result.get('n'))
+        ids and self._remove_translations(ids)
+        send_signal(after_delete, self.document_class.__name__, _id=None,
+                    ids=ids, spec=spec, collection=self)
+        return AttrDict(deleted_count=result.get('n'), ids=ids)
+
+    def remove(self, spec_or_id=None, safe=None, multi=True, **kwargs):
+        """ Overrided method for sending :after_delete: signal after
+            the removal with `ids` of removed documents, they are
+            fetched with `_id`-only projection before removal by spec
+            and only they are removed.
+            Single document is removed by spec with `find_and_modify`
+            if :multi: is False.
+        """
+        spec = spec_or_id
+        if isinstance(spec, dict):
+            spec = self._alias_spec(spec)
+        selector = spec
+        if spec is not None and not isinstance(spec, dict):
+            spec = selector = {'_id': spec_or_id}
+            ids = [spec_or_id]
+        elif spec and '_id' in spec and not isinstance(spec['_id'], dict):
+            # at most one document is matched
+            ids = [spec['_id']]
+        elif multi:
+            ids = self._collect_ids(spec or {})
+            selector = self._collected_spec(spec or {}, ids)
+        else:
+            ids = None
+
+        self._inspect('remove', spec)
+        if ids is None:
+            with self._timer('remove'):
+                son = Collection.find_and_modify(self, spec or {},
+                                                 remove=True,
+                                                 fields={'_id': True})
+            ids = son and [son['_id']] or []
+            result = {'ok': 1.0, 'n': len(ids)}
+        else:
+            with self._timer('remove'):
+                result = super(BaseQuery, self).remove(selector, safe, multi,
+                                                       **kwargs)
+            if result and not result.get('n'):
+                ids = []
+        self._count_written('remove', result and result.get('n') or 0)
+
+        ids and self._remove_translations(ids)
+        if ids:
+            send_signal(after_delete, self.document_class.__name__,
+                        _id=ids[0] if len(ids) == 1 else None, ids=ids,
+                        spec=spec, collection=self)
+        return result
 
-    def get(self, id):
-        return self.find_one({'_id': id}) or self.find_one({'_int_id': id})
+    def get(self, id, **shard_key):
+        """ Returns document by `_id` or `_int_id`, pass values of
+            :attr:`Model.shard_key` fields to target the query
+        """
+        return self.find_one(dict(shard_key, _id=id)) or \
+            self.find_one(dict(shard_key, _int_id=id))
 
-    def get_or_404(self, id):
-        return self.get(id) or abort(404)
+    def get_or_404(self, id, **shard_key):
+        return self.get(id, **shard_key) or abort(404)
 
     def find_one_or_404(self, *args, **kwargs):
         return self.find_one(*args, **kwargs) or abort(404)
 
+    def paginate(self, spec=None, sort=None, after=None, per_page=20,
+                 count=False, **kwargs):
+        """ Keyset pagination: instead of skipping documents, the next page
+            starts with a range query on the sort key and `_id` of the last
+            document of the previous page, so deep pages are as cheap
+            as the first one when the sort key is indexed.
+
+            :param sort: field name or (field, direction) tuple, by default
+                        pages are sorted by `_id`
+
+            :param after: :attr:`Page.next_token` of the previous page
+
+            :param count: if it is True - :attr:`Page.total` is counted
+                        for the spec, if it is 'estimate' - the cached
+                        collection size from :meth:`estimated_count` is used
+
+            Documents with null or missing sort key are sorted before
+            the others in ascending order and after them in descending one.
+        """
+        if sort is None:
+            sort = '_id'
+        key, direction = isinstance(sort, tuple) and sort or (sort, ASCENDING)
+        lang = kwargs.get('_lang', self.document_class._fallback_lang)
+        lang_key = self._lang_key(key, lang)
+        compare = direction == ASCENDING and '$gt' or '$lt'
+
+        query = copy.deepcopy(spec or {})
+        if after is not None:
+            value, _id = self._decode_token(after)
+            if key == '_id':
+                range_spec = {'_id': {compare: _id}}
+            else:
+                range_spec = {'$or': [{key: value, '_id': {compare: _id}}]}
+                # null doesn't compare with other values
+                if value is None and direction == ASCENDING:
+                    range_spec['$or'].append({key: {'$ne': None}})
+                elif value is not None:
+                    range_spec['$or'].append({key: {compare: value}})
+                    if direction != ASCENDING:
+                        range_spec['$or'].append({key: None})
+            query = {'$and': [query, range_spec]}
+
+        kwargs['sort'] = [(lang_key, direction), ('_id', direction)]
+        items = list(self.find(query, **kwargs).limit(per_page + 1))
+
+        next_token = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            last = items[-1]
+            next_token = self._encode_token(get_path(last, lang_key),
+                                            last['_id'])
+
+        total = None
+        if count == 'estimate':
+            total = self.estimated_count()
+        elif count:
+            kwargs.pop('sort')
+            total = self.find(copy.deepcopy(spec or {}), **kwargs).count()
+
+        return Page(items, next_token, total)
+
+    def estimated_count(self):
+        """ Returns number of documents in the collection from `collstats`,
+            cached for :attr:`count_cache_timeout` seconds
+        """
+        now = time.time()
+        count, expires = _count_cache.get(self.full_name, (None, 0))
+        if expires < now:
+            count = self.database.command('collstats', self.name)['count']
+            _count_cache[self.full_name] = (count,
+                                            now + self.count_cache_timeout)
+        return count
+
+    def _encode_token(self, value, _id):
+        son = BSON.encode({'value': value, '_id': _id})
+        return base64.urlsafe_b64encode(son)
+
+    def _decode_token(self, token):
+        try:
+            son = BSON(base64.urlsafe_b64decode(str(token))).decode()
+            return son['value'], son['_id']
+        except (TypeError, ValueError, KeyError, InvalidBSON):
+            raise InvalidTokenError("wrong pagination token {!r}"
+                                    .format(token))
+
+    def aggregate(self, pipeline=None, **kwargs):
+        """ Returns :class:`Aggregation` builder if :pipeline: isn't passed,
+            otherwise runs the :pipeline: as it is
+        """
+        if pipeline is not None:
+            return super(BaseQuery, self).aggregate(pipeline, **kwargs)
+        lang = kwargs.pop('_lang', self.document_class._fallback_lang)
+        return Aggregation(self, lang, **kwargs)
+
     def find_or_404(self, *args, **kwargs):
+        """ Returns cursor with the first batch already fetched instead of
+            counting all matched documents, so the cursor can't be sorted
+            or limited after that, pass `sort`, `limit`, etc. as kwargs
+        """
         cursor = self.find(*args, **kwargs)
-        return not cursor.count() == 0 and cursor or abort(404)
+        return cursor._refresh() and cursor or abort(404)
+
+    def exists(self, spec=None, **kwargs):
+        """ Checks if at least one document matches :spec:, only `_id`
+            of the first matched document is fetched
+        """
+        kwargs['manipulate'] = False
+        cursor = self.find(spec or {}, {'_id': True}, **kwargs)
+        return bool(cursor.limit(-1)._refresh())
 
     def _insert_lang(self, document, lang):
-        for attr in document.copy():
-            if attr.startswith('$') and attr != '$where':
-                document[attr] = map(lambda a: self._insert_lang(a, lang),
-                                     document[attr])
+        with Stage('insert_lang'):
+            for attr in document.copy():
+                if attr.startswith('$') and \
+                        isinstance(document[attr], list):
+                    document[attr] = map(
+                        lambda a: self._insert_lang(a, lang), document[attr])
+                else:
+                    key = self._alias_key(self._lang_key(attr, lang))
+                    if key != attr:
+                        document[key] = document.pop(attr)
+        return document
+
+    def declared_indexes(self, languages=()):
+        """ Returns list of (key, options) of indexes from
+            :attr:`Model.indexes`, every declaration is a separate index:
+
+            * 'name' or ('name', DESCENDING) - single field index
+
+            * [('category', ASCENDING), ('price', DESCENDING)] - compound
+              index, strings in the list are ascending fields
+
+            * {'key': <any of above>, 'unique': True} - index with options
+              for :meth:`create_index`, e.g. `sparse`, `expireAfterSeconds`,
+              `partialFilterExpression`
+
+            Indexes on translated fields are created for each language
+            of :param languages: with `field.<lang>` keys. Keys of aliased
+            fields are replaced with their :attr:`Model.aliases`.
+        """
+        indexes = []
+        for index in self.document_class.indexes:
+            options = {}
+            if isinstance(index, dict):
+                options = index.copy()
+                index = options.pop('key')
+            if isinstance(index, (basestring, tuple)):
+                index = [index]
+            key = [isinstance(field, basestring) and (field, ASCENDING)
+                   or tuple(field) for field in index]
+
+            if not self.i18n or not any(name.split('.')[0] in self.i18n
+                                        for name, _ in key):
+                if self.aliases:
+                    key = [(self._alias_key(name), direction)
+                           for name, direction in key]
+                    if 'partialFilterExpression' in options:
+                        options['partialFilterExpression'] = \
+                            self._alias_spec(
+                                options['partialFilterExpression'])
+                indexes.append((key, options))
+                continue
+
+            if self.document_class.i18n_collection:
+                # see translation_indexes
+                continue
+
+            for lang in languages:
+                lang_options = copy.deepcopy(options)
+                if 'name' in lang_options:
+                    lang_options['name'] += '_' + lang
+                if 'partialFilterExpression' in lang_options:
+                    self._insert_lang(lang_options['partialFilterExpression'],
+                                      lang)
+                indexes.append(([(self._alias_key(self._lang_key(name, lang)),
+                                  direction) for name, direction in key],
+                                lang_options))
+        return indexes
+
+    def translation_indexes(self):
+        """ Returns list of (key, options) of indexes for
+            :attr:`Model.i18n_collection`: unique index of translations
+            by document and language, and indexes from
+            :attr:`Model.indexes` with translated fields prefixed by `lang`
+        """
+        indexes = [([('doc', ASCENDING), ('lang', ASCENDING)],
+                    {'unique': True})]
+        for index in self.document_class.indexes:
+            options = {}
+            if isinstance(index, dict):
+                options = index.copy()
+                index = options.pop('key')
+            if isinstance(index, (basestring, tuple)):
+                index = [index]
+            key = [isinstance(field, basestring) and (field, ASCENDING)
+                   or tuple(field) for field in index]
+            if any(name.split('.')[0] in self.i18n for name, _ in key):
+                indexes.append(([('lang', ASCENDING)] + key, options))
+        return indexes
+
+    def _translations(self):
+        """ Returns collection of :attr:`Model.i18n_collection`
+        """
+        return self.database[self.document_class.i18n_collection]
+
+    def _translate_spec(self, spec, lang):
+        """ Changes translated attributes of :spec: for :lang:
+            and replaces names of fields with :attr:`Model.aliases`
+        """
+        if self.document_class.i18n_collection:
+            spec = self._match_translations(spec, lang)
+            return self.aliases and self._insert_lang(spec, lang) or spec
+        return self._insert_lang(spec, lang)
+
+    def _match_translations(self, spec, lang):
+        """ Replaces conditions on translated attributes in :spec: with
+            `_id` of documents, which translations in :lang: match them
+        """
+        translated = {}
+        for attr in spec.keys():
+            if attr in ('$and', '$or', '$nor'):
+                spec[attr] = [self._match_translations(item, lang)
+                              for item in spec[attr]]
+            elif attr.split('.')[0] in self.i18n:
+                translated[attr] = spec.pop(attr)
+        if not translated:
+            return spec
+
+        translated['lang'] = lang
+        ids = [son['doc'] for son in self._translations().find(
+            translated, {'doc': True}, manipulate=False)]
+        spec_ids = {'_id': {'$in': ids}}
+        return spec and {'$and': [spec, spec_ids]} or spec_ids
+
+    def _split_translations(self, document):
+        """ Returns copy of :document: without translated attributes and
+            dict of them, operators of update documents are split too
+        """
+        main, translated = {}, {}
+        for attr, value in document.iteritems():
+            if attr.startswith('$'):
+                main[attr], translated[attr] = self._split_translations(value)
+                main[attr] or main.pop(attr)
+                translated[attr] or translated.pop(attr)
+            elif attr.split('.')[0] in self.i18n:
+                translated[attr] = value
             else:
-                attrs = attr.split('.')
-                if attrs[0] in self.i18n and '$' not in attr:
-                    attrs.insert(1, lang)
-                    document['.'.join(attrs)] = document.pop(attr)
+                main[attr] = value
+        return main, translated
+
+    def _save_translations(self, _id, translated):
+        """ Replaces translation documents of document :_id: with
+            :translated: attributes, one document per language
+        """
+        languages = {}
+        for attr, values in translated.iteritems():
+            for lang, value in values.iteritems():
+                languages.setdefault(lang, {})[attr] = value
+        collection = self._translations()
+        for lang, document in languages.iteritems():
+            document.update(doc=_id, lang=lang)
+            collection.update({'doc': _id, 'lang': lang}, document,
+                              upsert=True, manipulate=False)
+
+    def _update_translations(self, spec, document, lang, multi=False):
+        """ Applies update :document: to translations in :lang: of
+            documents matched by :spec:, replacement :document: replaces
+            the translation document like :meth:`_save_translations` does
+        """
+        if '_id' in spec and not isinstance(spec['_id'], dict):
+            ids = [spec['_id']]
+        else:
+            ids = self._collect_ids(spec, limit=0 if multi else 1)
+        replace = not any(key.startswith('$') for key in document)
+        collection = self._translations()
+        for _id in ids:
+            collection.update({'doc': _id, 'lang': lang},
+                              replace and dict(document, doc=_id, lang=lang)
+                              or document, upsert=True, manipulate=False)
+
+    def _remove_translations(self, ids):
+        if self.document_class.i18n_collection:
+            self._translations().remove({'doc': {'$in': ids}})
+
+    def _update(self, spec, document, **kwargs):
+        """ Updates documents without signals, changes translated
+            attributes in the :document: for :_lang:
+        """
+        lang = kwargs.pop('_lang', self.document_class._fallback_lang)
+        if self.document_class.i18n_collection:
+            if isinstance(document, Update):
+                document = document.document
+            document, translated = self._split_translations(document)
+            if translated:
+                self._update_translations(spec, translated, lang,
+                                          kwargs.get('multi'))
+            if not document:
+                return None
+        document = self._translate_update(document, lang)
+        self._inspect('update', spec)
+        with self._timer('update'):
+            result = super(BaseQuery, self).update(spec, document, **kwargs)
+        self._count_written('update', isinstance(result, dict) and
+                            result.get('n', 0) or 0)
+        return result
+
+    def _translate_update(self, document, lang):
+        """ Returns update :document: with translated attributes changed
+            for :lang: and aliased fields renamed, instances of
+            :class:`Update` are converted to dict
+        """
+        if isinstance(document, Update):
+            document = copy.deepcopy(document.document)
+
+        if self.i18n or self.aliases:
+            for attr, value in document.items():
+                if attr.startswith('$'):
+                    document[attr] = self._insert_lang(value, lang)
+                else:
+                    del document[attr]
+                    document[self._alias_key(attr)] = \
+                        {lang: value} if attr in self.i18n else value
         return document
 
+    def _collect_ids(self, spec, limit=0):
+        """ Returns `_id` of documents matched by :spec:, fetches only them,
+            at most :limit: if it isn't 0
+        """
+        cursor = Collection.find(self, spec, {'_id': True}, manipulate=False,
+                                 limit=limit)
+        return [son['_id'] for son in cursor]
+
+    def _collected_spec(self, spec, ids):
+        """ Returns :spec: limited to collected :ids:, so documents which
+            start to match it after the ids are fetched aren't changed
+        """
+        if ids is None:
+            return spec
+        return {'$and': [spec, {'_id': {'$in': ids}}]}
+
+    def _timer(self, operation):
+        """ Returns :class:`Timer` of :operation: round trips
+        """
+        return Timer(self.document_class._metrics, 'operation_seconds',
+                     self.document_class.__name__, operation)
+
+    def _count_written(self, operation, count):
+        metrics = self.document_class._metrics
+        if metrics is not None and count:
+            metrics.inc('documents_written', self.document_class.__name__,
+                        operation, count)
+
+    def _inspect(self, operation, spec):
+        """ Passes query to :attr:`Model._inspector` if it is set,
+            counts queries of sharded models without the shard key
+        """
+        if self.document_class.shard_key and isinstance(spec or {}, dict):
+            self._check_shard_key(operation, spec or {})
+        inspector = self.document_class._inspector
+        if inspector is not None and isinstance(spec or {}, dict):
+            inspector.inspect(self, operation, spec or {})
+
+    def _check_shard_key(self, operation, spec):
+        """ Counts :spec: in :data:`untargeted_queries` if it doesn't have
+            all fields of :attr:`Model.shard_key`, so it's broadcast to all
+            shards, the first one of the model and operation is logged
+        """
+        fields = set(spec)
+        for item in spec.get('$and', []):
+            fields.update(item)
+        if all(self._alias_key(key) in fields
+               for key in self.document_class.shard_key):
+            return
+
+        key = (self.document_class.__name__, operation)
+        untargeted_queries[key] = untargeted_queries.get(key, 0) + 1
+        if untargeted_queries[key] == 1:
+            logger.warning("%s query of sharded model %s without shard key "
+                           "%s is sent to all shards: %r", operation, key[0],
+                           self.document_class.shard_key, spec)
+
+    def _shard_spec(self, _id, document):
+        """ Returns query of :document: by :_id: with values of
+            :attr:`Model.shard_key` fields of the document
+        """
+        spec = {'_id': _id}
+        for key in self.document_class.shard_key:
+            value = get_path(document, key)
+            if value is not None:
+                spec[key] = value
+        return spec
+
+    def _lang_key(self, attr, lang):
+        """ Inserts :lang: into the dotted path of translated attribute
+        """
+        attrs = attr.split('.')
+        if self.i18n and attrs[0] in self.i18n and '$' not in attr:
+            attrs.insert(1, lang)
+        return '.'.join(attrs)
+
+    def _alias_key(self, attr):
+        """ Replaces the first name of dotted path :attr: with its alias
+            from :attr:`Model.aliases`
+        """
+        name, dot, path = attr.partition('.')
+        alias = self.aliases.get(name)
+        return alias is None and attr or alias + dot + path
+
+    def _alias_spec(self, spec):
+        """ Returns copy of :spec: with aliased names of fields,
+            conditions of `$and`, `$or` and `$nor` are renamed too
+        """
+        if not self.aliases:
+            return spec
+        aliased = {}
+        for attr, value in spec.iteritems():
+            if attr in ('$and', '$or', '$nor'):
+                value = map(self._alias_spec, value)
+            aliased[self._alias_key(attr)] = value
+        return aliased
+
+    def _alias_document(self, document):
+        """ Returns copy of :document: to store with aliased names of
+            fields, the :document: is returned if model has no aliases
+        """
+        if not self.aliases:
+            return document
+        return dict((self.aliases.get(attr, attr), value)
+                    for attr, value in document.iteritems())
+
+    def _alias_fields(self, fields):
+        """ Returns projection :fields: (list or dict) with aliased names
+        """
+        if isinstance(fields, dict):
+            return dict((self._alias_key(attr), value)
+                        for attr, value in fields.iteritems())
+        return map(self._alias_key, fields)
+
     def delete(self):
         return self.drop()
 
@@ -298,10 +2113,47 @@ class BaseQuery(Collection):
         return self.find()
 
 
+class LangView(object):
+    """ Read-only view of :model: in :lang:, translated fields are resolved
+        for :lang:, other attributes are taken from the model, so the data
+        and cached translations are shared with it
+    """
+    __slots__ = ('_model', '_lang')
+
+    def __init__(self, model, lang):
+        object.__setattr__(self, '_model', model)
+        object.__setattr__(self, '_lang', lang)
+
+    def __getattr__(self, attr):
+        if attr in LangView.__slots__:
+            raise AttributeError(attr)
+        model = self._model
+        if attr in model.i18n:
+            return model._translate(attr, self._lang)
+        return getattr(model, attr)
+
+    def __setattr__(self, attr, value):
+        raise TypeError("{} is read-only".format(self.__class__.__name__))
+
+    __delattr__ = __setattr__
+
+    def __getitem__(self, key):
+        return self._model[key]
+
+    def __contains__(self, key):
+        return key in self._model
+
+    def __iter__(self):
+        return iter(self._model)
+
+    def __len__(self):
+        return len(self._model)
+
+
 class ModelType(type):
     """ Changes validation rules for transleted attrs.
         Implements inheritance for attrs :i18n:, :indexes:
-        and :structure: from __abstract__ model
+        and :structure: from __abstract__ model, collects :aliases:
         Adds :_protected_field_names: into class and :indexes: into Mondodb
     """
     def __new__(cls, name, bases, dct):
@@ -319,9 +2171,12 @@ class ModelType(type):
                 key_attrs = ['i18n', 'indexes', 'required_fields']
 
                 for attr in key_attrs:
-                    base_attrs = set(getattr(model, attr, []))
-                    child_attrs = set(dct.get(attr, []))
-                    dct.update({attr: list(base_attrs | child_attrs)})
+                    # indexes could be unhashable, so lists are merged:
+                    child_attrs = list(dct.get(attr, []))
+                    child_attrs.extend(value for value in
+                                       getattr(model, attr, [])
+                                       if value not in child_attrs)
+                    dct.update({attr: child_attrs})
 
                 if model.structure and structure is not None:
                     base_structure = set(model.structure.keys)
@@ -364,28 +2219,49 @@ class ModelType(type):
                 struct = dict.fromkeys(required_fields, t.Any)
                 dct['structure'] = t.Dict(struct).allow_extra('*')
 
+        # stored names of fields from `to_name` of structure keys, they
+        # are renamed by BaseQuery, so validation keeps the names:
+        aliases = {}
+        for model in reversed(bases):
+            aliases.update(getattr(model, 'aliases', {}))
+        aliases.update(dct.get('aliases', {}))
+        if dct.get('structure') is not None:
+            for key in dct['structure'].keys:
+                if key.to_name and key.to_name != key.name:
+                    aliases[key.name] = key.to_name
+                    key.to_name = None
+        dct['aliases'] = aliases
+
         return type.__new__(cls, name, bases, dct)
 
     def __init__(cls, name, bases, dct):
         # set protected_field_names:
         protected_field_names = set(['_protected_field_names'])
         names = [model.__dict__.keys() for model in cls.__mro__]
-        cls._protected_field_names = list(protected_field_names.union(*names))
+        cls._protected_field_names = frozenset(
+            protected_field_names.union(*names))
+        cls._stored_names = dict((alias, name) for name, alias in
+                                 cls.aliases.iteritems())
 
         if not cls.__abstract__:
             # add model into autoincrement_id register:
             if cls.inc_id:
                 inc_collections.add(cls.__collection__)
 
-            # add indexes:
+            if cls.__collection__:
+                registered_models.append(cls)
+
+            # models declared after MongoSet.init_app:
+            if cls.__bind__ is not None and cls._mongoset is not None:
+                cls.db = cls._mongoset.get_db(cls.__bind__)
+
+            # normalize indexes, they are created by MongoSet.sync_indexes:
             if cls.indexes:
                 for index in cls.indexes[:]:
-                    if isinstance(index, str):
+                    if isinstance(index, basestring):
                         cls.indexes.remove(index)
-                        cls.indexes.append((index, ASCENDING))
-
-                if cls.db:
-                    cls.query.ensure_index(cls.indexes)
+                        if (index, ASCENDING) not in cls.indexes:
+                            cls.indexes.append((index, ASCENDING))
 
 
 class Model(AttrDict):
@@ -395,6 +2271,10 @@ class Model(AttrDict):
 
         :param __collection__: name of mongo collection
 
+        :param __bind__: optional, name of database from MONGODB_BINDS
+                    to keep the collection in, by default it is
+                    MONGODB_DATABASE
+
         :param __abstract__: if True - there is an abstract Model,
                     so :param i18n:, :param structure: and
                     :param indexes: shall be added for submodels
@@ -410,9 +2290,15 @@ class Model(AttrDict):
 
         :param i18n: optional, list of fields that need to translate
 
+        :param i18n_collection: optional, name of collection to keep
+                    translated fields in, one document per document and
+                    language, by default translations are kept in
+                    the document as {field: {lang: value}}
+
         :param db: Mondodb, it is defining by MongoSet
 
-        :param indexes: optional, list of fields that need to index
+        :param indexes: optional, list of index declarations, see
+                    :meth:`BaseQuery.declared_indexes`
 
         :param query_class: class makes query to MongoDB,
                     by default it is :BaseQuery:
@@ -422,19 +2308,48 @@ class Model(AttrDict):
 
         :param required_fields: optional, list of required fields
 
-        :param use_autorefs: optional, if it is True - AutoReferenceObject
-                    will be use for query, by default is True
+        :param use_autorefs: optional, if it is True and MONGODB_AUTOREF
+                    is set - saved embedded documents are stored as DBRefs,
+                    by default is True
 
         :param inc_id: optional, if it if True - AutoincrementId
                     will be use for query, by default is False
 
+        :param shard_key: optional, list of shard key fields of sharded
+                    collection, they are added to queries of instances by
+                    `_id`, queries without them are counted in
+                    `untargeted_queries`
+
+        :param aliases: optional, {field: stored name} short names to store
+                    fields with, fields are renamed in documents, queries,
+                    sorts, projections and indexes, `to_name` of keys of
+                    :structure: are added by ModelType metaclass
+
+        :param _stored_names: {stored name: field}, sets automatically
+
         :param from_db: attr to get object from db as instance,
                     sets automatically
+
+        :param _inspector: :class:`QueryInspector` to explain queries with,
+                    sets by MongoSet if MONGODB_EXPLAIN_SAMPLE_RATE is set
+
+        :param _metrics: :class:`Metrics` or another collector of
+                    operation metrics, sets by MongoSet if MONGODB_METRICS
+                    is set
+
+        :param _raw_fields: fields of instance loaded with `lazy=True`,
+                    which aren't converted by SON manipulators yet,
+                    {field: None or set of not converted languages}
+
+        :param _resolved: cached values of translated fields,
+                    {(field, language): value}, sets automatically
     """
     __metaclass__ = ModelType
 
     __collection__ = None
 
+    __bind__ = None
+
     __abstract__ = False
 
     _protected_field_names = None
@@ -445,8 +2360,13 @@ class Model(AttrDict):
 
     i18n = []
 
+    i18n_collection = None
+
     db = None
 
+    # MongoSet which resolves :param __bind: of models, sets automatically
+    _mongoset = None
+
     indexes = []
 
     query_class = BaseQuery
@@ -459,30 +2379,68 @@ class Model(AttrDict):
 
     inc_id = False
 
+    shard_key = []
+
+    aliases = {}
+
+    _stored_names = {}
+
     from_db = False
 
+    _inspector = None
+
+    _metrics = None
+
+    _raw_fields = None
+
+    _resolved = None
+
     def __init__(self, initial=None, **kwargs):
-        self.from_db = kwargs.pop('from_db', False)
-        self._lang = kwargs.pop('_lang', self._fallback_lang)
-        if not self.from_db:
-            self._class = ".".join([self.__class__.__module__,
-                                    self.__class__.__name__])
-        dct = kwargs.copy()
-
-        if initial and isinstance(initial, dict):
-            dct.update(**initial)
-
-        for field in self._protected_field_names:
-            if field in dct and not isinstance(getattr(self.__class__,
-                                                       field, None), property):
-                raise AttributeError("Forbidden attribute name {} for"
-                            " model {}".format(field, self.__class__.__name__))
-        super(Model, self).__init__(initial, **kwargs)
+        with Stage('init'):
+            self.from_db = kwargs.pop('from_db', False)
+            self._lang = kwargs.pop('_lang', self._fallback_lang)
+            lazy = kwargs.pop('lazy', False)
+            if not self.from_db:
+                self._class = ".".join([self.__class__.__module__,
+                                        self.__class__.__name__])
+            if self.from_db and not kwargs and isinstance(initial, dict):
+                # decoded documents aren't shared, so they aren't copied
+                dct = initial
+            else:
+                dct = kwargs.copy()
+                if initial and isinstance(initial, dict):
+                    dct.update(initial)
+            if self.from_db and self._stored_names:
+                dct = self._unalias(dct)
+
+            for field in self._protected_field_names:
+                if field in dct and not isinstance(
+                        getattr(self.__class__, field, None), property):
+                    raise AttributeError(
+                        "Forbidden attribute name {} for model {}".format(
+                            field, self.__class__.__name__))
+
+            if self.from_db and lazy:
+                dict.update(self, dct)
+                self._raw_fields = dict(
+                    (key, key in self.i18n and isinstance(value, dict) and
+                     set(value) or None) for key, value in dct.iteritems())
+            elif self.from_db:
+                # stored documents aren't translated, so only embedded
+                # documents, which aren't decoded into AttrDict, are wrapped
+                make_attr_dict = self._make_attr_dict
+                dict.update(self, ((key, make_attr_dict(value, True))
+                                   for key, value in dct.iteritems()))
+            else:
+                super(Model, self).__init__(initial, **kwargs)
 
     def __setattr__(self, attr, value):
         if attr in self._protected_field_names:
             return dict.__setattr__(self, attr, value)
 
+        if self._raw_fields and attr in self._raw_fields:
+            self._load(attr)
+
         if attr in self.i18n and not self.from_db:
             if attr not in self:
                 if not isinstance(value, dict) or self._lang not in value:
@@ -494,11 +2452,103 @@ class Model(AttrDict):
         return super(Model, self).__setattr__(attr, value)
 
     def __getattr__(self, attr):
-        value = super(Model, self).__getattr__(attr)
         if attr in self.i18n:
-            value = value.get(self._lang,
-                              value.get(self._fallback_lang, value))
-        return value
+            return self._translate(attr, self._lang)
+        if self._raw_fields and attr in self._raw_fields:
+            self._load(attr)
+        return super(Model, self).__getattr__(attr)
+
+    def __getitem__(self, key):
+        if self._raw_fields and key in self._raw_fields:
+            self._load(key)
+        return super(Model, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if self._resolved:
+            self._resolved = None
+        return super(Model, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self._resolved:
+            self._resolved = None
+        return super(Model, self).__delitem__(key)
+
+    def __delattr__(self, attr):
+        if self._resolved:
+            self._resolved = None
+        return super(Model, self).__delattr__(attr)
+
+    def _translate(self, attr, lang):
+        """ Returns value of translated :attr: in :lang: or in fallback
+            language, values are cached per language until the instance
+            is changed
+        """
+        resolved = self._resolved
+        if resolved is None:
+            resolved = self._resolved = {}
+        key = (attr, lang)
+        if key not in resolved:
+            if self._raw_fields and attr in self._raw_fields:
+                self._load(attr, lang)
+            try:
+                value = dict.__getitem__(self, attr)
+            except KeyError as ex:
+                raise AttributeError(ex)
+            if isinstance(value, dict):
+                if lang in value:
+                    value = value[lang]
+                else:
+                    value = value.get(self._fallback_lang, value)
+            resolved[key] = value
+        return resolved[key]
+
+    @classmethod
+    def _unalias(cls, document):
+        """ Returns copy of stored :document: with names of fields
+            instead of :attr:`aliases`
+        """
+        stored_names = cls._stored_names
+        return dict((stored_names.get(key, key), value)
+                    for key, value in document.iteritems())
+
+    def _unit_of_work(self):
+        """ Returns current :class:`UnitOfWork` to collect changes of
+            the instance, changes of models with :attr:`i18n_collection`
+            are written immediately
+        """
+        return not self.i18n_collection and current_unit_of_work() or None
+
+    def as_lang(self, lang):
+        """ Returns read-only :class:`LangView` of the instance in :lang:,
+            the data isn't copied
+        """
+        return LangView(self, lang)
+
+    def _load(self, attr, lang=None):
+        """ Converts stored value of :attr: of lazy loaded instance,
+            for translated fields only value of :lang: is converted if
+            it is given
+        """
+        value = dict.__getitem__(self, attr)
+        langs = self._raw_fields[attr]
+        if langs is None:
+            del self._raw_fields[attr]
+            return dict.__setitem__(self, attr, self._convert(value))
+
+        if lang is not None:
+            lang = lang in value and lang or self._fallback_lang
+        for key in list(langs):
+            if lang is None or key == lang:
+                langs.remove(key)
+                value[key] = self._convert(value[key])
+        langs or self._raw_fields.pop(attr)
+
+    def _convert(self, value):
+        """ Applies SON manipulators of :db: to stored :value:
+        """
+        if isinstance(value, (dict, list, DBRef)):
+            value = self.db._fix_outgoing(value, self.query)
+        return self._make_attr_dict(value, True)
 
     @classproperty
     def query(cls):
@@ -506,14 +2556,27 @@ class Model(AttrDict):
                                document_class=cls)
 
     def save(self, *args, **kwargs):
-        data = self.structure and self.structure.check(self) or self
+        with Timer(self._metrics, 'validation_seconds',
+                   self.__class__.__name__, 'save'):
+            data = self.structure and self.structure.check(self) or self
+        unit_of_work = self._unit_of_work()
+        if unit_of_work is not None:
+            _id = unit_of_work.save(self.query, data)
+            # the checked data is a copy, the instance needs `_id` for
+            # the following changes in the scope
+            dict.setdefault(self, '_id', _id)
+            return _id
         return self.query.save(data, *args, **kwargs)
 
     def save_with_reload(self, *args, **kwargs):
-        """ returns self with autorefs after save
+        """ returns self with autorefs after save, flushes changes
+            of current :meth:`MongoSet.session_scope`
         """
         _id = self.save(*args, **kwargs)
-        return self.query.find_one({'_id': _id}, _lang=self._lang)
+        unit_of_work = current_unit_of_work()
+        unit_of_work and unit_of_work.flush()
+        return self.query.find_one(self.query._shard_spec(_id, self),
+                                   _lang=self._lang)
 
     def update(self, data=None, **kwargs):
         if data is None:
@@ -526,19 +2589,39 @@ class Model(AttrDict):
         if self.i18n:
             kwargs['_lang'] = self._lang
 
-        return self.query.update({"_id": self._id}, data, **kwargs)
+        unit_of_work = self._unit_of_work()
+        if unit_of_work is not None:
+            result = unit_of_work.update(self.query, self._id, data,
+                                         self._lang, self._spec())
+        else:
+            result = self.query.update(self._spec(), data, **kwargs)
+        # operators which can't be applied locally are left for reload
+        if isinstance(data, Update) and data.applicable():
+            data.apply(self, self.i18n, self._lang)
+            self._resolved = None
+        return result
 
     def update_with_reload(self, data=None, **kwargs):
-        """ returns self with autorefs after update
+        """ returns self with autorefs after update, flushes changes
+            of current :meth:`MongoSet.session_scope`
         """
         self.update(data, **kwargs)
-        result = self.query.find_one({'_id': self._id})
-        if self.i18n:
-            result._lang = self._lang
+        unit_of_work = current_unit_of_work()
+        unit_of_work and unit_of_work.flush()
+        result = self.query.find_one(self._spec(), _lang=self._lang)
         return result
 
     def delete(self):
-        return self.query.remove(self._id)
+        unit_of_work = self._unit_of_work()
+        if unit_of_work is not None:
+            return unit_of_work.delete(self.query, self._id, self._spec())
+        return self.query.remove(self.shard_key and self._spec() or self._id)
+
+    def _spec(self):
+        """ Returns query of the instance by `_id` and :attr:`shard_key`
+            fields, so it's routed to one shard
+        """
+        return self.query._shard_spec(self._id, self)
 
     @classmethod
     def create(cls, *args, **kwargs):
@@ -565,6 +2648,123 @@ class Model(AttrDict):
         return str(self).decode('utf-8')
 
 
+class UnitOfWork(object):
+    """ Collects saves, updates and deletes of models in
+        :meth:`MongoSet.session_scope` and writes them with one ordered bulk
+        operation per collection on :meth:`flush`. Changes of the same
+        document are coalesced: updates are merged or applied to
+        the pending save if :meth:`Update.applicable`, a delete drops
+        previous changes.
+
+        Signals are sent after flush, one per collection and kind of change
+        with `ids` of changed documents.
+    """
+    def __init__(self):
+        # {(collection full name, _id): (query, [[kind, document], ...])}
+        self.pending = OrderedDict()
+        # {(collection full name, _id): query of the document with
+        #  the shard key}
+        self.specs = {}
+
+    def save(self, query, document):
+        kind = '_id' in document and 'save' or 'insert'
+        document.setdefault('_id', ObjectId())
+        operations = self._operations(query, document['_id'],
+                                      query._shard_spec(document['_id'],
+                                                        document))
+        if operations and operations[0][0] == 'insert':
+            kind = 'insert'
+        operations[:] = [[kind, document]]
+        return document['_id']
+
+    def update(self, query, _id, document, lang=None, spec=None):
+        document = query._translate_update(document, lang)
+        operations = self._operations(query, _id, spec)
+        if not operations:
+            operations.append(['update', document])
+            return
+
+        kind, pending = operations[-1]
+        if kind == 'delete':
+            return
+
+        if kind == 'update':
+            merged = merge_updates(pending, document)
+            if merged is not None:
+                operations[-1][1] = merged
+                return
+        elif not any(key.startswith('$') for key in document):
+            document['_id'] = _id
+            operations[-1][1] = document
+            return
+        else:
+            update = Update()
+            update.document = document
+            # paths of the update are aliased unlike the pending document
+            if update.applicable() and not query.aliases:
+                pending = copy.deepcopy(pending)
+                update.apply(pending)
+                operations[-1][1] = pending
+                return
+        operations.append(['update', document])
+
+    def delete(self, query, _id, spec=None):
+        operations = self._operations(query, _id, spec)
+        if operations and operations[0][0] == 'insert':
+            del self.pending[(query.full_name, _id)]
+        else:
+            operations[:] = [['delete', None]]
+
+    def flush(self):
+        """ Writes pending changes to the database and sends signals
+        """
+        collections = OrderedDict()
+        for key, (query, operations) in self.pending.iteritems():
+            spec = self.specs.get(key) or {'_id': key[1]}
+            collections.setdefault(key[0], (query, []))[1].extend(
+                (spec, kind, document) for kind, document in operations)
+        self.pending = OrderedDict()
+        self.specs = {}
+
+        for query, operations in collections.itervalues():
+            bulk = Collection.initialize_ordered_bulk_op(query)
+            ids = OrderedDict()
+            for spec, kind, document in operations:
+                _id = spec['_id']
+                selector = bulk.find(query._alias_spec(spec))
+                if kind == 'delete':
+                    selector.remove_one()
+                elif kind == 'update' and any(key.startswith('$')
+                                              for key in document):
+                    selector.update_one(document)
+                elif kind == 'update':
+                    document = query.database._fix_incoming(
+                        dict(document, _id=_id), query)
+                    selector.replace_one(document)
+                else:
+                    document = query.database._fix_incoming(
+                        query._alias_document(document), query)
+                    selector.upsert().replace_one(document)
+                ids.setdefault(kind, []).append(_id)
+            with query._timer('bulk'):
+                result = bulk.execute()
+            query._count_written('bulk', result and sum(
+                result.get(key, 0) for key in ('nInserted', 'nUpserted',
+                                               'nModified', 'nRemoved')))
+
+            for kind, kind_ids in ids.iteritems():
+                signal = {'insert': after_insert,
+                          'delete': after_delete}.get(kind, after_update)
+                send_signal(signal, query.document_class.__name__,
+                            _id=kind_ids[0] if len(kind_ids) == 1 else None,
+                            ids=kind_ids, collection=query)
+
+    def _operations(self, query, _id, spec=None):
+        key = (query.full_name, _id)
+        spec and self.specs.setdefault(key, spec)
+        return self.pending.setdefault(key, (query, []))[1]
+
+
 def get_state(app):
     """Gets the state for the application"""
     assert 'mongoset' in app.extensions, \
@@ -606,6 +2806,12 @@ class MongoSet(object):
     """
     def __init__(self, app=None):
         self.Model = Model
+        # {bind name or None: connection}
+        self._connections = {}
+        # {bind name: database}
+        self._databases = {}
+        # process which uses the connections
+        self._pid = None
 
         if app is not None:
             self.init_app(app)
@@ -622,77 +2828,314 @@ class MongoSet(object):
         app.config.setdefault('MONGODB_AUTOINCREMENT', False)
         app.config.setdefault('MONGODB_FALLBACK_LANG', 'en')
         app.config.setdefault('MONGODB_SLAVE_OKAY', False)
+        app.config.setdefault('MONGODB_AUTO_INDEX', False)
+        app.config.setdefault('MONGODB_LANGUAGES', [])
+        app.config.setdefault('MONGODB_EXPLAIN_SAMPLE_RATE', 0)
+        app.config.setdefault('MONGODB_CONNECT', False)
+        app.config.setdefault('MONGODB_BINDS', {})
+        app.config.setdefault('MONGODB_METRICS', False)
+        app.config.setdefault('MONGODB_PROFILE_HEADER', None)
+        app.config.setdefault('MONGODB_PROFILE_SAMPLE_RATE', 0)
+        app.config.setdefault('MONGODB_MAX_QUERIES', None)
+        app.config.setdefault('MONGODB_MAX_DOCS', None)
+        app.config.setdefault('MONGODB_QUERY_BUDGET_WARN', False)
         self.app = app
         if not hasattr(app, 'extensions'):
             app.extensions = {}
         app.extensions['mongoset'] = self
-        self.connect()
+
+        # before any connection, their pools observe waits
+        self.metrics = app.config['MONGODB_METRICS'] or None
+        if self.metrics is True:
+            self.metrics = Metrics()
+        self.Model._metrics = self.metrics
+
+        if app.config['MONGODB_CONNECT']:
+            self.connect()
+
+        @app.before_request
+        def check_connection():
+            # closes sockets inherited from the parent process
+            get_state(app).connection
 
         @app.teardown_appcontext
         def close_connection(response):
-            state = get_state(app)
-            if state.connection is not None:
-                state.connection.end_request()
+            for connection in get_state(app)._connections.itervalues():
+                connection.end_request()
             return response
 
+        self.profiles = deque(maxlen=100)
+        if app.config['MONGODB_PROFILE_HEADER'] or \
+                app.config['MONGODB_PROFILE_SAMPLE_RATE']:
+
+            @app.before_request
+            def start_profiler():
+                header = app.config['MONGODB_PROFILE_HEADER']
+                if header and header in request.headers or random.random() < \
+                        app.config['MONGODB_PROFILE_SAMPLE_RATE']:
+                    _local.profiler = Profiler(' '.join([request.method,
+                                                         request.path]))
+
+            @app.teardown_appcontext
+            def report_profile(exception):
+                profiler = current_profiler()
+                if profiler is not None:
+                    _local.profiler = None
+                    report = profiler.report()
+                    get_state(app).profiles.append(report)
+                    logger.info(format_profile(report))
+
+        if app.config['MONGODB_MAX_QUERIES'] is not None or \
+                app.config['MONGODB_MAX_DOCS'] is not None:
+
+            @app.before_request
+            def start_query_budget():
+                _local.request_budget = self.query_budget(
+                    app.config['MONGODB_MAX_QUERIES'],
+                    app.config['MONGODB_MAX_DOCS'],
+                    app.config['MONGODB_QUERY_BUDGET_WARN'],
+                    ' '.join([request.method, request.path]))
+                _local.request_budget.__enter__()
+
+            @app.teardown_appcontext
+            def end_query_budget(exception):
+                # restores the budget which encloses the request
+                budget = getattr(_local, 'request_budget', None)
+                if budget is not None:
+                    _local.request_budget = None
+                    budget.__exit__(None, None, None)
+
         self.Model.db = self.session
+        self.Model._mongoset = self
         self.Model._fallback_lang = app.config.get('MONGODB_FALLBACK_LANG')
+        for model in registered_models:
+            if model.__bind__ is not None:
+                model.db = self.get_db(model.__bind__)
+
+        self.inspector = None
+        if app.config['MONGODB_EXPLAIN_SAMPLE_RATE']:
+            self.inspector = QueryInspector(
+                app.config['MONGODB_EXPLAIN_SAMPLE_RATE'],
+                languages=self.languages)
+        self.Model._inspector = self.inspector
+
+        if hasattr(app, 'cli'):
+            import click
+
+            @app.cli.command('mongo-sync-indexes')
+            def sync_indexes_command():
+                """Creates missing MongoDB indexes of models."""
+                for collection, key in self.sync_indexes():
+                    click.echo("{}: {}".format(collection, key))
 
     def connect(self):
-        """Connect to the MongoDB server and register the documents from
-        :attr:`registered_documents`. If you set ``MONGODB_USERNAME`` and
-        ``MONGODB_PASSWORD`` then you will be authenticated at the
-        ``MONGODB_DATABASE``.
+        """Connect to the MongoDB server now instead of the first query.
+        If you set ``MONGODB_USERNAME`` and ``MONGODB_PASSWORD`` then
+        the credentials are checked at the ``MONGODB_DATABASE``.
+        Called by :meth:`init_app` if ``MONGODB_CONNECT`` is True.
         """
-        if not hasattr(self, 'app'):
+        if not getattr(self, 'app', None):
             raise RuntimeError('The mongoset extension was not init to '
                                'the current application.  Please make sure '
                                'to call init_app() first.')
-        if not hasattr(self, 'connection'):
-            self.connection = Connection(
-                host=self.app.config.get('MONGODB_HOST'),
-                port=self.app.config.get('MONGODB_PORT'),
-                slave_okay=self.app.config.get('MONGODB_SLAVE_OKAY', False))
-
-        if self.app.config.get('MONGODB_USERNAME') is not '':
-            auth_success = self.session.authenticate(
-                self.app.config.get('MONGODB_USERNAME'),
-                self.app.config.get('MONGODB_PASSWORD'))
-            if not auth_success:
-                raise AuthenticationError("can't connect to data base,"
-                                          " wrong user_name or password")
+        try:
+            self.session.command('ping')
+        except OperationFailure:
+            raise AuthenticationError("can't connect to data base,"
+                                      " wrong user_name or password")
+
+    @property
+    def connection(self):
+        """ Returns connection of the current process, see
+            :meth:`get_connection`
+        """
+        return self.get_connection()
+
+    def get_connection(self, bind=None):
+        """ Returns connection of :bind: from ``MONGODB_BINDS`` or
+            the default one for the current process. It's created on
+            first use without network round trips, sockets inherited from
+            the parent process are closed after fork
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            for connection in self._connections.itervalues():
+                connection.disconnect()
+            self._pid = pid
+        if bind not in self._connections:
+            self._connections[bind] = self._create_connection(bind)
+        return self._connections[bind]
+
+    def get_db(self, bind=None):
+        """ Returns database of :bind: with its own SON manipulators,
+            the default database if :bind: is None
+        """
+        if bind is None:
+            return self.session
+        if bind not in self._databases:
+            options = self._bind_options(bind)
+            self._databases[bind] = self._create_db(
+                self.get_connection(bind), options)
+        return self._databases[bind]
+
+    def _bind_options(self, bind):
+        """ Returns dict of connection options of :bind:, bind could be
+            configured with an URI or a dict with `host`, `port`,
+            `database`, `username`, `password`, `read_preference`,
+            `autoref` and `autoincrement` keys
+        """
+        config = self.app.config
+        if bind is None:
+            return {'host': config.get('MONGODB_HOST'),
+                    'port': config.get('MONGODB_PORT'),
+                    'database': config.get('MONGODB_DATABASE'),
+                    'username': config.get('MONGODB_USERNAME'),
+                    'password': config.get('MONGODB_PASSWORD'),
+                    'slave_okay': config.get('MONGODB_SLAVE_OKAY', False)}
+        try:
+            options = config['MONGODB_BINDS'][bind]
+        except KeyError:
+            raise RuntimeError("Bind {!r} isn't set in MONGODB_BINDS"
+                               .format(bind))
+        if isinstance(options, basestring):
+            options = {'host': options}
+        return options
+
+    def _create_connection(self, bind=None):
+        """ Creates connection, credentials are cached and will be checked
+            by pymongo when the first socket is opened
+        """
+        options = self._bind_options(bind)
+        kwargs = dict((key, options[key]) for key in ('read_preference',
+                                                       'slave_okay')
+                      if key in options)
+        if self.Model._metrics is not None:
+            kwargs['_pool_class'] = MetricsPool
+        connection = MongoConnection(host=options.get('host'),
+                                     port=options.get('port'),
+                                     _connect=False, **kwargs)
+        if options.get('username'):
+            database = options['database']
+            credentials = auth._build_credentials_tuple(
+                'DEFAULT', database, options['username'],
+                options.get('password'), {})
+            connection._cache_credentials(database, credentials,
+                                          connect=False)
+        return connection
+
+    def _create_db(self, connection, options):
+        """ Returns database of :connection: with :class:`DocumentPipeline`
+        """
+        config = self.app.config
+        if options.get('database'):
+            db = connection[options['database']]
+        else:
+            db = connection.get_default_database()
+        pipeline = DocumentPipeline(
+            db,
+            autoref=options.get('autoref', config['MONGODB_AUTOREF']),
+            autoincrement=options.get('autoincrement',
+                                      config['MONGODB_AUTOINCREMENT']))
+        db.add_son_manipulator(pipeline)
+        if pipeline.autoref:
+            db.add_son_manipulator(pipeline.references)
+        return db
 
     def register(self, *models):
         """Register one or more :class:`mongoset.Model` instances to the
         connection.
         """
         for model in models:
-            if not model.db or not isinstance(model.db, Database):
+            if model.__bind__ is not None:
+                setattr(model, 'db', self.get_db(model.__bind__))
+            elif not model.db or not isinstance(model.db, Database):
                 setattr(model, 'db', self.session)
 
-            model.indexes and model.query.ensure_index(model.indexes)
-
             setattr(model, '_fallback_lang',
                     self.app.config['MONGODB_FALLBACK_LANG'])
 
+        if self.app.config['MONGODB_AUTO_INDEX']:
+            self.sync_indexes(*models)
+
         return len(models) == 1 and models[0] or models
 
+    def sync_indexes(self, *models):
+        """ Creates indexes from :attr:`Model.indexes` that are missing in
+            the database, for all models with indexes by default.
+            Returns list of (collection name, index key) of created indexes
+        """
+        models = models or [model for model in registered_models
+                            if model.db is not None]
+        created = []
+        for model in models:
+            query = model.query
+            collections = [(query, model.indexes and
+                            query.declared_indexes(self.languages))]
+            if model.i18n_collection:
+                collections.append((query._translations(),
+                                    query.translation_indexes()))
+
+            for collection, indexes in collections:
+                if not indexes:
+                    continue
+                existing = [index['key'] for index in
+                            collection.index_information().itervalues()]
+                for key, options in indexes:
+                    if key not in existing:
+                        collection.create_index(key, **options)
+                        existing.append(key)
+                        created.append((collection.name, key))
+        return created
+
+    @contextmanager
+    def session_scope(self):
+        """ Collects saves, updates and deletes of models and writes them
+            with bulk operations at exit, see :class:`UnitOfWork`.
+            Nothing is written if an exception is raised. Nested scopes
+            use the outer one::
+
+                with mongo.session_scope():
+                    for row in rows:
+                        product = Product.query.get(row['id'])
+                        product.update(Update().inc(quantity=row['quantity']))
+        """
+        unit_of_work = current_unit_of_work()
+        if unit_of_work is not None:
+            yield unit_of_work
+            return
+
+        _local.unit_of_work = unit_of_work = UnitOfWork()
+        try:
+            yield unit_of_work
+            unit_of_work.flush()
+        finally:
+            _local.unit_of_work = None
+
+    def query_budget(self, max_queries=None, max_docs=None, warn=False,
+                     name=None):
+        """ Returns :class:`QueryBudget` context manager or decorator
+            to limit number of queries and fetched documents, e.g.
+            to catch N+1 queries in tests::
+
+                with mongo.query_budget(max_queries=2):
+                    client.get('/products')
+        """
+        return QueryBudget(max_queries, max_docs, warn, name)
+
+    @property
+    def languages(self):
+        """ Returns languages of translated indexes
+        """
+        return (self.app.config['MONGODB_LANGUAGES'] or
+                [self.app.config['MONGODB_FALLBACK_LANG']])
+
     @property
     def session(self):
         """ Returns MongoDB
         """
         if not hasattr(self, "db"):
-            self.db = self.connection[self.app.config['MONGODB_DATABASE']]
-            # we need namespaces in any case
-            self.db.add_son_manipulator(NamespaceInjector())
-
-            if self.app.config['MONGODB_AUTOREF']:
-                self.db.add_son_manipulator(AutoReference(self.db))
-
-            if self.app.config['MONGODB_AUTOINCREMENT']:
-                self.db.add_son_manipulator(AutoincrementId())
-
-            self.db.add_son_manipulator(SavedObject())
+            self.db = self._create_db(self.connection,
+                                      self._bind_options(None))
         return self.db
 
     def clear(self):
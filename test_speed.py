@@ -1,4 +1,5 @@
 import cProfile
+import resource
 import flask
 from flask_mongoset import MongoSet
 
@@ -30,6 +31,24 @@ def find_model(interval):
         SomeModel.query.find({"test.name": "testing_{}".format(i)})
 
 
+def read_model(interval):
+    for i in interval[:10]:
+        list(SomeModel.query.find())
+
+
+def read_large_model(interval):
+    """ Reads a document of about 2 MB, returns growth of max RSS in KB
+    """
+    items = [{"name": "testing_{}".format(i), "tags": ["a", "b", "c"]}
+             for i in range(30000)]
+    SomeModel({"large": True, "items": items}).save()
+    del items
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for i in interval[:10]:
+        SomeModel.query.find_one({"large": True})
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+
+
 def update_model(interval):
     instance = SomeModel.query.find_one({"test.name": "testing_5"})
     for i in interval:
@@ -48,6 +67,10 @@ if __name__ == '__main__':
     #new with translation, for interval = 1000:  42003 function calls in 0.065-0.079 seconds
     #v 1.08: 46003 function calls in 0.068 seconds
 
+    cProfile.run('read_model(interval)')
+
+    print 'max RSS growth: {} KB'.format(read_large_model(interval))
+
     cProfile.run('update_model(interval)')
     #new : for interval = 1000: 85132 function calls in 0.219-0.224 seconds
     #v 1.08: 46243 function calls (46232 primitive calls) in 0.097 seconds
@@ -1,8 +1,10 @@
 from operator import methodcaller, attrgetter
 import flask
 from bson.dbref import DBRef
+from flask.signals import signals_available
 from werkzeug.exceptions import NotFound
-from flask.ext.mongoset import MongoSet, Model
+from flask.ext.mongoset import (MongoSet, Model, Update, signal_map,
+                                after_delete)
 
 
 mongo = MongoSet()
@@ -94,6 +96,122 @@ class BaseModelTest(BaseTest):
         assert result.test == "Hello"
         assert isinstance(result, self.model)
 
+    def test_update_operators(self):
+        result = self.model.create(test="hello", views=1, tags=['a'])
+        result.update(Update().inc(views=2).push(tags='b')
+                              .set(stats__rating=5))
+        assert result.views == 3
+        assert result.tags == ['a', 'b']
+        assert result.stats.rating == 5
+
+        reloaded = self.model.query.find_one({'_id': result._id})
+        assert reloaded.views == 3
+        assert reloaded.tags == ['a', 'b']
+        assert reloaded.stats.rating == 5
+
+        self.model.query.update_many({'test': 'hello'},
+                                     Update().unset('stats').pull(tags='a'))
+        reloaded = self.model.query.find_one({'_id': result._id})
+        assert 'stats' not in reloaded
+        assert reloaded.tags == ['b']
+
+        update = Update().pull(tags={'$regex': '^b'})
+        assert not update.applicable()
+        reloaded.update(update)
+        assert reloaded.tags == ['b']
+        assert self.model.query.find_one({'_id': result._id}).tags == []
+
+    def test_update_and_delete_many(self):
+        for i in range(3):
+            self.insert({"test": "many", "number": i})
+        self.insert({"test": "other", "number": 0})
+
+        result = self.model.query.update_many({"test": "many"},
+                                              Update().inc(number=10),
+                                              collect_ids=True)
+        assert result.matched_count == 3
+        assert len(result.ids) == 3
+        assert self.model.query.find({"number": {"$gte": 10}}).count() == 3
+
+        result = self.model.query.delete_many({"number": {"$gte": 11}})
+        assert result.deleted_count == 2
+        assert result.ids is None
+        assert self.model.query.count() == 2
+
+    def test_remove(self):
+        ids = [self.insert({"test": "remove"}) for i in range(3)]
+        result = self.model.query.remove({"test": "remove"}, multi=False)
+        assert result['n'] == 1
+        assert self.model.query.count() == 2
+        assert self.model.query.remove(ids[2])['n'] == 1
+        assert self.model.query.remove({"test": "remove"})['n'] == 1
+        assert not self.model.query.count()
+
+    def test_remove_signal(self):
+        if not signals_available:
+            return
+        ids = [self.insert({"test": "remove"}) for i in range(2)]
+        received = []
+
+        def receiver(sender, **kwargs):
+            count = self.model.query.find({"test": "remove"}).count()
+            received.append((kwargs['ids'], count))
+
+        signal_map[after_delete].connect(receiver)
+        try:
+            self.model.query.remove({"test": "remove"})
+            self.model.query.remove({"test": "remove"})
+        finally:
+            signal_map[after_delete].disconnect(receiver)
+        assert received == [(ids, 0)]
+
+    def test_remove_collected_ids(self):
+        ids = [self.insert({"test": "remove"}) for i in range(2)]
+        query = self.model.query
+        # the second document starts to match after ids are collected
+        query._collect_ids = lambda spec, limit=0: ids[:1]
+        assert query.remove({"test": "remove"})['n'] == 1
+        assert self.model.query.find({"test": "remove"}).count() == 1
+
+        query._collect_ids = lambda spec, limit=0: []
+        assert not query.delete_many({"test": "remove"},
+                                     collect_ids=True).deleted_count
+        assert self.model.query.find({"test": "remove"}).count() == 1
+
+    def test_session_scope(self):
+        with self.mongo.session_scope():
+            first = self.model({'test': 'scope', 'number': 1})
+            first.save()
+            first.update(Update().inc(number=1))
+            first.update(Update().inc(number=1))
+            second = self.model({'test': 'scope', 'number': 5})
+            second.save()
+            second.delete()
+            assert not self.model.query.find({'test': 'scope'}).count()
+
+        result = self.model.query.find({'test': 'scope'})
+        assert result.count() == 1
+        assert result[0].number == 3
+
+        try:
+            with self.mongo.session_scope():
+                first.delete()
+                raise ValueError
+        except ValueError:
+            pass
+        assert self.model.query.find({'test': 'scope'}).count() == 1
+
+    def test_session_scope_unapplicable_update(self):
+        with self.mongo.session_scope():
+            result = self.model({'test': 'scope', 'number': 2, 'tags': []})
+            result.save()
+            result.update({'$mul': {'number': 3}})
+            result.update(Update().push(tags={'$each': ['b', 'a'],
+                                              '$sort': 1}))
+        result = self.model.query.find_one({'test': 'scope'})
+        assert result.number == 6
+        assert result.tags == ['a', 'b']
+
     def test_not_override_default_variables(self):
         try:
             self.model({"query_class": "Hello"})
@@ -144,6 +262,15 @@ class BaseModelTest(BaseTest):
             'parents': [DBRef(parent.__collection__, parent._id)]})
         assert child.parents[0].test == "test_two"
 
+    def test_exists(self):
+        self.insert({"test": "hello world"})
+        assert self.model.query.exists({"test": "hello world"})
+        assert self.model.query.exists()
+        assert not self.model.query.exists({"test": "something else"})
+
+        cursor = self.model.query.find_or_404({"test": "hello world"})
+        assert [item.test for item in cursor] == ["hello world"]
+
     def test_404(self):
         try:
             self.model.query.get_or_404('4879453489')
@@ -162,3 +289,70 @@ class BaseModelTest(BaseTest):
             assert False
         except NotFound:
             assert True
+
+    def test_stream(self):
+        for i in range(5):
+            self.insert({"test": "stream", "number": i})
+        self.insert({"test": "other"})
+
+        chunks = list(self.model.query.stream({"test": "stream"},
+                                              batch_size=2))
+        assert map(len, chunks) == [2, 2, 1]
+        assert isinstance(chunks[0][0], self.model)
+
+        after = chunks[0][-1]._id
+        chunks = list(self.model.query.stream({"test": "stream"}, chunk=10,
+                                              raw=True, after=after))
+        assert len(chunks) == 1
+        assert [doc['number'] for doc in chunks[0]] == [2, 3, 4]
+        assert not isinstance(chunks[0][0], self.model)
+
+    def test_paginate(self):
+        for i in [3, 1, 4, 0, 2]:
+            self.insert({"test": "page", "number": i})
+
+        page = self.model.query.paginate({"test": "page"}, sort='number',
+                                         per_page=2, count=True)
+        assert [item.number for item in page] == [0, 1]
+        assert page.has_next
+        assert page.total == 5
+
+        page = self.model.query.paginate({"test": "page"}, sort='number',
+                                         per_page=2, after=page.next_token)
+        assert [item.number for item in page] == [2, 3]
+        assert page.total is None
+
+        page = self.model.query.paginate({"test": "page"}, sort='number',
+                                         per_page=2, after=page.next_token)
+        assert [item.number for item in page] == [4]
+        assert not page.has_next
+
+        page = self.model.query.paginate({"test": "page"}, sort='number',
+                                         per_page=3, frozen=True)
+        page = self.model.query.paginate({"test": "page"}, sort='number',
+                                         per_page=3, frozen=True,
+                                         after=page.next_token)
+        assert [item.number for item in page] == [3, 4]
+
+        page = self.model.query.paginate({"test": "page"},
+                                         sort=('number', -1), per_page=3)
+        assert [item.number for item in page] == [4, 3, 2]
+
+    def test_paginate_missing_key(self):
+        for document in [{"number": 1}, {"number": None}, {"number": 0},
+                         {}]:
+            document["test"] = "page"
+            self.insert(document)
+
+        for direction, expected in [(1, [None, None, 0, 1]),
+                                    (-1, [1, 0, None, None])]:
+            numbers, token = [], None
+            while True:
+                page = self.model.query.paginate(
+                    {"test": "page"}, sort=('number', direction), per_page=1,
+                    after=token)
+                numbers.extend(item.get('number') for item in page)
+                token = page.next_token
+                if not page.has_next:
+                    break
+            assert numbers == expected
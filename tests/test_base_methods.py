@@ -1,5 +1,7 @@
-from flask.ext.mongoset import AttrDict
-from conftest import BaseTest
+import os
+import flask
+from flask.ext.mongoset import AttrDict, MongoSet, current_budget
+from conftest import BaseTest, SomeModel
 
 
 class TestAttrDict(BaseTest):
@@ -24,3 +26,61 @@ class TestAttrDict(BaseTest):
         assert self.mongo.app
         assert self.mongo.connection
         assert self.mongo.db.name == "testdb"
+
+    def test_lazy_connection(self):
+        app = flask.Flask(__name__)
+        app.config['MONGODB_HOST'] = 'mongo.invalid'
+        app.config['MONGODB_DATABASE'] = 'testdb'
+        try:
+            mongo = MongoSet(app)
+            assert mongo.session.name == 'testdb'
+            assert not mongo.connection.nodes
+        finally:
+            self.mongo.init_app(self.app)
+
+    def test_connection_after_fork(self):
+        connection = self.mongo.connection
+        self.mongo._pid = None
+        assert self.mongo.connection is connection
+        assert self.mongo._pid == os.getpid()
+
+    def test_profile_request(self):
+        app = flask.Flask(__name__)
+        app.config['MONGODB_DATABASE'] = 'testdb'
+        app.config['MONGODB_PROFILE_HEADER'] = 'X-Profile'
+
+        @app.route('/')
+        def index():
+            SomeModel(name='profiled', tags=[{'a': 1}])
+            return 'ok'
+
+        try:
+            mongo = MongoSet(app)
+            client = app.test_client()
+            client.get('/')
+            assert not mongo.profiles
+            client.get('/', headers={'X-Profile': '1'})
+            report = mongo.profiles[-1]
+            assert report['name'] == 'GET /'
+            assert report['stages']['init'][1] == 1
+            assert report['stages']['wrap'][1] == 1
+        finally:
+            self.mongo.init_app(self.app)
+
+    def test_request_query_budget(self):
+        app = flask.Flask(__name__)
+        app.config['MONGODB_DATABASE'] = 'testdb'
+        app.config['MONGODB_MAX_QUERIES'] = 10
+
+        @app.route('/')
+        def index():
+            return 'ok'
+
+        try:
+            mongo = MongoSet(app)
+            with mongo.query_budget(max_queries=5) as budget:
+                app.test_client().get('/')
+                assert current_budget() is budget
+            assert current_budget() is None
+        finally:
+            self.mongo.init_app(self.app)
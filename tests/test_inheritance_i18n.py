@@ -1,7 +1,10 @@
+import sys
+import threading
 import trafaret as t
 from pymongo import DESCENDING
 from conftest import BaseTest
-from flask.ext.mongoset import Model
+from flask.ext.mongoset import FrozenDocument, Model, Update, freeze, \
+    _key_tables, _key_tables_size
 
 
 class BaseModel(Model):
@@ -30,6 +33,12 @@ class i18nModel(BaseModel):
     indexes = [('quantity', DESCENDING), 'name']
 
 
+class SeparateModel(BaseModel):
+    __collection__ = "i18nseparatetests"
+    i18n_collection = "i18nseparatetests_translations"
+    structure = t.Dict({t.Key('stock', default=0): t.Int}).allow_extra('*')
+
+
 class TestValidation(BaseTest):
 
     model = i18nModel
@@ -38,6 +47,121 @@ class TestValidation(BaseTest):
         super(TestValidation, self).setUp()
         self.mongo.register(self.model)
 
+    def test_translated_indexes(self):
+        self.app.config['MONGODB_LANGUAGES'] = ['en', 'fr']
+        try:
+            self.mongo.sync_indexes(self.model)
+        finally:
+            self.app.config['MONGODB_LANGUAGES'] = []
+        keys = [index['key'] for index in
+                self.model.query.index_information().values()]
+        assert [('name.en', 1)] in keys
+        assert [('name.fr', 1)] in keys
+        assert [('quantity', DESCENDING)] in keys
+
+    def test_aggregate(self):
+        for quantity in [1, 2]:
+            self.model.create({'name': 'Name', 'quantity': quantity,
+                               'attrs': {'feature': 'ice', 'revision': 1},
+                               'list_attrs': ['one', 'two']}, _lang='en')
+
+        result = self.model.query.aggregate(_lang='en')\
+            .match({'attrs.feature': 'ice'})\
+            .group({'_id': '$name', 'total': {'$sum': '$quantity'}})\
+            .all()
+        assert result == [{'_id': 'Name', 'total': 3}]
+
+        result = self.model.query.aggregate(_lang='en', as_model=True)\
+            .sort('quantity', DESCENDING).limit(1).all()
+        assert isinstance(result[0], self.model)
+        assert result[0].name == 'Name'
+        assert result[0].quantity == 2
+
+    def test_update_operators(self):
+        result = self.model.get_or_create({'name': 'Name', 'quantity': 1,
+                                    'attrs': {'feature': 'ice', 'revision': 1},
+                                    'list_attrs': ['one', 'two']}, _lang='en')
+        result._lang = 'fr'
+        result.update(Update().set(name='Nom').push(list_attrs='trois')
+                              .inc(quantity=2))
+        assert result.name == 'Nom'
+        assert result.list_attrs == ['trois']
+        assert result.quantity == 3
+
+        result = self.model.query.find_one({'name': 'Nom'}, _lang='fr')
+        assert result.list_attrs == ['trois']
+        assert result.quantity == 3
+        result._lang = 'en'
+        assert result.name == 'Name'
+        assert result.list_attrs == ['one', 'two']
+
+    def test_frozen(self):
+        self.model.create({'name': 'Name', 'quantity': 1,
+                           'attrs': {'feature': 'ice', 'revision': 1},
+                           'list_attrs': ['one', 'two']}, _lang='en')
+
+        result = self.model.query.find_one({'quantity': 1}, _lang='en',
+                                           frozen=True)
+        assert isinstance(result, FrozenDocument)
+        assert result.name == 'Name'
+        assert result.list_attrs == ('one', 'two')
+        assert result['name'] == {'en': 'Name'}
+        try:
+            result.name = 'Other'
+            assert False
+        except TypeError:
+            assert True
+
+        instance = result.to_model()
+        assert isinstance(instance, self.model)
+        assert freeze(instance) == result
+
+    def test_frozen_key_tables(self):
+        for i in range(_key_tables_size + 10):
+            FrozenDocument({'attr{}'.format(i): i})
+        assert len(_key_tables) == _key_tables_size
+        assert FrozenDocument({'attr0': 0}).attr0 == 0
+
+    def test_frozen_key_tables_threads(self):
+        errors = []
+
+        def freeze_documents(start):
+            try:
+                for i in range(start, start + _key_tables_size):
+                    FrozenDocument({'attr{}'.format(i % 1500): i})
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=freeze_documents,
+                                    args=(i * 100,)) for i in range(8)]
+        # switches threads often to expose races
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+        assert not errors
+        assert len(_key_tables) == _key_tables_size
+
+    def test_as_lang(self):
+        result = self.model({'name': 'Name', 'quantity': 1}, _lang='en')
+        result._lang = 'fr'
+        result.name = 'Nom'
+        assert result.name == 'Nom'
+
+        view = result.as_lang('en')
+        assert view.name == 'Name'
+        assert view.quantity == 1
+        assert view['name'] == {'en': 'Name', 'fr': 'Nom'}
+
+        result.name = 'Le nom'
+        assert result.name == 'Le nom'
+        assert result.as_lang('de').name == 'Name'
+
     def test_validate_translated_attrs(self):
         try:
             self.model.create({'name': 1, 'quantity': 1})
@@ -201,3 +325,47 @@ class TestValidation(BaseTest):
             _lang='fr').count() == 1
         assert self.model.query.find(
             {'$where': 'this.attrs.en.revision > 50'}).count() == 1
+
+
+class TestTranslationsCollection(BaseTest):
+
+    model = SeparateModel
+
+    def setUp(self):
+        super(TestTranslationsCollection, self).setUp()
+        self.mongo.register(self.model)
+
+    def test_translate(self):
+        result = self.model.create({'name': 'Name', 'quantity': 1,
+                                    'attrs': {'feature': 'ice'}}, _lang='en')
+        son = self.mongo.db.i18nseparatetests.find_one({'_id': result._id},
+                                                       manipulate=False)
+        assert 'name' not in son
+        assert son['quantity'] == 1
+
+        result._lang = 'fr'
+        result = result.update_with_reload(name='Nom')
+        assert result.name == 'Nom'
+        assert result.attrs.feature == 'ice'
+        assert self.mongo.db.i18nseparatetests_translations.find(
+            {'doc': result._id}).count() == 2
+
+        result = self.model.query.find_one({'name': 'Nom'}, _lang='fr')
+        assert result.quantity == 1
+        assert result['name'] == {'en': 'Name', 'fr': 'Nom'}
+        assert not self.model.query.find_one({'name': 'Nom'}, _lang='en')
+
+        result = self.model.query.find_one({'quantity': 1}, _lang='de')
+        assert result['name'] == {'en': 'Name'}
+        assert result.name == 'Name'
+
+        self.model.query.update({'quantity': 1},
+                                {'name': 'Nouveau', 'quantity': 2},
+                                _lang='fr')
+        translation = self.mongo.db.i18nseparatetests_translations.find_one(
+            {'doc': result._id, 'lang': 'fr'})
+        assert translation['name'] == 'Nouveau'
+
+        result.delete()
+        assert not self.mongo.db.i18nseparatetests_translations.find(
+            {'doc': result._id}).count()
@@ -1,5 +1,10 @@
-from flask.ext.mongoset import Model
-from conftest import BaseModelTest, SomeModel, SomedbModel, app, mongo
+import trafaret as t
+from bson.dbref import DBRef
+from flask.ext.mongoset import (AttrDict, DocumentPipeline, Metrics, Model,
+                                QueryBudgetExceeded, QueryInspector,
+                                current_budget, untargeted_queries)
+from conftest import (BaseTest, BaseModelTest, SomeModel, SomedbModel, app,
+                      mongo)
 
 
 app.config['MONGODB_HOST'] = "localhost"
@@ -8,6 +13,7 @@ app.config['MONGODB_DATABASE'] = "testdb"
 app.config['MONGODB_AUTOREF'] = True
 app.config['MONGODB_AUTOINCREMENT'] = True
 app.config['TESTING'] = True
+app.config['MONGODB_BINDS'] = {'other': 'mongodb://localhost:27017/otherdb'}
 mongo.init_app(app)
 
 
@@ -18,6 +24,29 @@ class NewModel(Model):
     indexes = ['id', 'name']
 
 
+class EmbeddedModel(Model):
+    __collection__ = 'embeddedtests'
+    use_autorefs = False
+
+
+class BoundModel(Model):
+    __collection__ = 'boundtests'
+    __bind__ = 'other'
+
+
+class ShardedModel(Model):
+    __collection__ = 'shardedtests'
+    shard_key = ['region']
+
+
+class AliasedModel(Model):
+    __collection__ = 'aliasedtests'
+    aliases = {'quantity': 'q'}
+    structure = t.Dict({t.Key('description', to_name='d'): t.String,
+                        t.Key('quantity', default=0): t.Int}).allow_extra('*')
+    indexes = ['description']
+
+
 class TestModelDecorator(BaseModelTest):
 
     def setUp(self):
@@ -40,3 +69,210 @@ class TestModelRegistration(BaseModelTest):
     def setUp(self):
         super(TestModelRegistration, self).setUp()
         self.mongo.register(self.model)
+
+
+class TestIndexes(BaseModelTest):
+    model = NewModel
+
+    def test_sync_indexes(self):
+        created = self.mongo.sync_indexes(self.model)
+        assert created == [('decotests', [('id', 1)]),
+                           ('decotests', [('name', 1)])]
+        assert not self.mongo.sync_indexes(self.model)
+
+
+class TestQueryInspector(BaseTest):
+
+    def test_inspect_unindexed_query(self):
+        inspector = QueryInspector()
+        NewModel._inspector = inspector
+        try:
+            NewModel.create(name='Hello', color='red')
+            list(NewModel.query.find({'color': 'red'}))
+            list(NewModel.query.find({'color': 'blue'}))
+        finally:
+            NewModel._inspector = None
+
+        assert len(inspector.reports) == 1
+        report = inspector.reports[0]
+        assert report['collscan']
+        assert report['unindexed'] == ['color']
+
+
+class TestUseAutorefs(BaseTest):
+
+    def test_embedded_documents(self):
+        parent = NewModel.create(name='parent')
+        child = EmbeddedModel.create(name='child', parent=parent)
+        assert isinstance(child.parent, NewModel)
+        assert child.parent.name == 'parent'
+
+        son = self.mongo.db.embeddedtests.find_one({'_id': child._id},
+                                                   manipulate=False)
+        assert son['parent']['name'] == 'parent'
+
+    def test_saved_id(self):
+        parent = NewModel.create(name='parent')
+        child = NewModel({'name': 'child', 'parent': parent})
+        child.save()
+        assert '_id' in child
+        document = {'name': 'document', 'parent': parent}
+        NewModel.query.insert(document)
+        assert '_id' in document
+        assert document['parent'] is parent
+
+    def test_lazy(self):
+        parent = NewModel.create(name='parent')
+        NewModel.create(name='child', parent=parent)
+
+        child = NewModel.query.find_one({'name': 'child'}, lazy=True)
+        assert isinstance(dict.get(child, 'parent'), DBRef)
+        assert child.parent.name == 'parent'
+        assert isinstance(child.parent, NewModel)
+        assert 'parent' not in child._raw_fields
+        assert 'name' in child._raw_fields
+
+
+class TestDocumentPipeline(BaseTest):
+
+    def test_transform_outgoing(self):
+        path = '.'.join([NewModel.__module__, NewModel.__name__])
+        son = AttrDict(items=[{'_class': path, 'name': 'embedded'}])
+        items = son['items']
+
+        pipeline = DocumentPipeline(self.mongo.db)
+        assert pipeline.transform_outgoing(son, None) is son
+        assert son['items'] is items
+        assert isinstance(items[0], NewModel)
+
+        son = AttrDict(items=[{'name': 'embedded'}])
+        pipeline = DocumentPipeline(self.mongo.db, in_place=False)
+        result = pipeline.transform_outgoing(son, None)
+        assert result == son
+        assert result['items'] is not son['items']
+
+
+class TestBinds(BaseTest):
+
+    def teardown(self):
+        self.mongo.get_connection('other').drop_database('otherdb')
+        super(TestBinds, self).teardown()
+
+    def test_bind(self):
+        self.mongo.register(BoundModel)
+        result = BoundModel.create(name='bound')
+        assert BoundModel.db.name == 'otherdb'
+        assert self.mongo.get_db('other').boundtests.find_one(result._id)
+        assert not self.mongo.db.boundtests.find_one(result._id)
+        assert self.mongo.get_connection('other') is not mongo.connection
+
+    def test_bind_declared_later(self):
+        class LaterBoundModel(Model):
+            __collection__ = 'boundtests'
+            __bind__ = 'other'
+
+        assert LaterBoundModel.db is self.mongo.get_db('other')
+
+
+class TestShardKey(BaseTest):
+
+    def test_targeted_queries(self):
+        untargeted_queries.clear()
+        result = ShardedModel.create(name='sharded', region='eu')
+        assert result._spec() == {'_id': result._id, 'region': 'eu'}
+
+        result.update({'$set': {'name': 'updated'}})
+        assert ShardedModel.query.get(result._id, region='eu').name == \
+            'updated'
+        result.delete()
+        assert not untargeted_queries
+
+        ShardedModel.query.find_one({'name': 'updated'})
+        assert untargeted_queries == {('ShardedModel', 'find'): 1}
+
+
+class TestMetrics(BaseTest):
+
+    def test_collect(self):
+        metrics = Metrics()
+        NewModel._metrics = metrics
+        try:
+            NewModel.create(name='Hello')
+            list(NewModel.query.find({'name': 'Hello'}))
+            NewModel.query.delete_many({'name': 'Hello'})
+        finally:
+            NewModel._metrics = None
+
+        # create() reloads the instance
+        assert metrics.counters[('documents_written', 'NewModel',
+                                 'insert')] == 1
+        assert metrics.counters[('documents_written', 'NewModel',
+                                 'remove')] == 1
+        assert metrics.counters[('documents_read', 'NewModel', 'find')] == 2
+        assert ('validation_seconds', 'NewModel', 'save') in \
+            metrics.histograms
+        text = metrics.render()
+        assert '# TYPE mongoset_operation_seconds histogram' in text
+        assert 'mongoset_operation_seconds_count{model="NewModel",' \
+            'operation="find"} 2' in text
+
+
+class TestQueryBudget(BaseTest):
+
+    def test_query_budget(self):
+        ids = [NewModel.create(name='Hello')._id for i in range(3)]
+        with self.mongo.query_budget(max_queries=1) as budget:
+            assert len(list(NewModel.query.find())) == 3
+        assert budget.documents == 3
+
+        try:
+            with self.mongo.query_budget(max_queries=2):
+                for _id in ids:
+                    NewModel.query.get(_id)
+        except QueryBudgetExceeded:
+            pass
+        else:
+            assert False, "N+1 queries aren't caught"
+
+    def test_reenter(self):
+        budget = self.mongo.query_budget(max_queries=1)
+        with budget:
+            try:
+                with budget:
+                    pass
+            except RuntimeError:
+                pass
+            else:
+                assert False, "budget is entered twice"
+            assert current_budget() is budget
+        assert current_budget() is None
+
+        with budget:
+            assert current_budget() is budget
+        assert current_budget() is None
+
+
+class TestAliases(BaseTest):
+
+    def test_stored_names(self):
+        assert AliasedModel.aliases == {'description': 'd', 'quantity': 'q'}
+        result = AliasedModel.create(description='long', quantity=2)
+        stored = self.mongo.session.aliasedtests.find_one(result._id,
+                                                          manipulate=False)
+        assert stored['d'] == 'long' and stored['q'] == 2
+        assert 'description' not in stored
+
+        result.update({'$inc': {'quantity': 1}})
+        result = AliasedModel.query.find_one({'description': 'long'},
+                                             ['quantity'])
+        assert result.quantity == 3
+        assert AliasedModel.query.declared_indexes() == [([('d', 1)], {})]
+
+    def test_session_scope(self):
+        with self.mongo.session_scope():
+            result = AliasedModel(description='long', quantity=2)
+            result.save()
+            result.update({'$set': {'quantity': 5}})
+        stored = self.mongo.session.aliasedtests.find_one(result._id,
+                                                          manipulate=False)
+        assert stored['q'] == 5 and 'quantity' not in stored